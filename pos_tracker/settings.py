@@ -69,6 +69,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "tracker.middleware.TimezoneMiddleware",  # Custom middleware
+    "tracker.middleware.AuditLogBufferMiddleware",  # Batch audit log writes per request
     "tracker.middleware.AutoProgressOrdersMiddleware",  # Auto-progress orders
 ]
 
@@ -169,8 +170,24 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/login/"
 LOGIN_URL = "/login/"
 
-# Session settings
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Cache: shared Redis when REDIS_URL is set (requires the redis package), else per-process memory
+_redis_url = os.environ.get('REDIS_URL')
+if _redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': _redis_url,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Session settings (write-through cache in front of the DB-backed session table)
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
 
 # Security settings for production
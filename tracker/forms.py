@@ -4,7 +4,8 @@ import random
 import json
 from django import forms
 from django.contrib.auth.models import User, Group
-from .models import Customer, Order, Vehicle, InventoryItem, Profile, InventoryAdjustment, Branch, ServiceType, ServiceAddon
+from .models import Customer, Order, Vehicle, InventoryItem, Profile, InventoryAdjustment, Branch
+from .utils import get_service_types, get_service_addons, catalog_minutes
 
 
 class InventoryItemForm(forms.ModelForm):
@@ -478,6 +479,9 @@ class OrderForm(forms.ModelForm):
         })
     )
 
+    # Primary key of the inventory item resolved in clean() for sales orders
+    inventory_item_id = None
+
     class Meta:
         model = Order
         fields = [
@@ -518,11 +522,11 @@ class OrderForm(forms.ModelForm):
         if not self.fields["estimated_duration"].initial:
             self.fields["estimated_duration"].initial = 50
 
-        # Dynamic service types from DB, attach durations mapping for front-end
+        # Dynamic service types (cached catalog), attach durations mapping for front-end
         try:
-            svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-            svc_choices = [(s.name, s.name) for s in svc_qs]
-            durations_map = {s.name: int(s.estimated_minutes or 0) for s in svc_qs}
+            svc_list = get_service_types()
+            svc_choices = [(s['name'], s['name']) for s in svc_list]
+            durations_map = {s['name']: s['estimated_minutes'] for s in svc_list}
             self.fields['service_selection'].choices = svc_choices
             # Attach mapping for JS to consume
             self.fields['service_selection'].widget.attrs['data-service-durations'] = json.dumps(durations_map)
@@ -530,11 +534,11 @@ class OrderForm(forms.ModelForm):
             # Keep empty choices on error
             self.fields['service_selection'].choices = []
 
-        # Dynamic service addons from DB, attach durations mapping for front-end
+        # Dynamic service addons (cached catalog), attach durations mapping for front-end
         try:
-            addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-            addon_choices = [(a.name, a.name) for a in addon_qs]
-            addon_durations_map = {a.name: int(a.estimated_minutes or 0) for a in addon_qs}
+            addon_list = get_service_addons()
+            addon_choices = [(a['name'], a['name']) for a in addon_list]
+            addon_durations_map = {a['name']: a['estimated_minutes'] for a in addon_list}
             self.fields['tire_services'].choices = addon_choices
             # Attach mapping for JS to consume
             self.fields['tire_services'].widget.attrs['data-addon-durations'] = json.dumps(addon_durations_map)
@@ -545,21 +549,21 @@ class OrderForm(forms.ModelForm):
         # Dynamic item choices with brand info from inventory
         try:
             # Get all active inventory items with their brands
-            items = InventoryItem.objects.select_related('brand').filter(is_active=True).order_by('brand__name', 'name')
+            items = InventoryItem.objects.filter(is_active=True).order_by('brand__name', 'name').values('id', 'name', 'quantity', 'brand__name')
             
             # Create combined item choices (value = item_id, label = "Brand - Item Name")
             item_choices = [('', 'Select item')]
             item_brand_map = {}
             
             for item in items:
-                if item.name:
-                    brand_name = item.brand.name if item.brand else 'Unbranded'
-                    label = f"{brand_name} - {item.name}"
-                    item_choices.append((item.id, label))
-                    item_brand_map[str(item.id)] = {
-                        'name': item.name,
+                if item['name']:
+                    brand_name = item['brand__name'] or 'Unbranded'
+                    label = f"{brand_name} - {item['name']}"
+                    item_choices.append((item['id'], label))
+                    item_brand_map[str(item['id'])] = {
+                        'name': item['name'],
                         'brand': brand_name,
-                        'quantity': item.quantity
+                        'quantity': item['quantity']
                     }
             
             self.fields["item_name"].widget = forms.Select(
@@ -620,6 +624,7 @@ class OrderForm(forms.ModelForm):
                     item = InventoryItem.objects.select_related('brand').get(id=item_id)
                     cleaned["item_name"] = item.name
                     cleaned["brand"] = item.brand.name if item.brand else "Unbranded"
+                    self.inventory_item_id = item.id
                 except InventoryItem.DoesNotExist:
                     self.add_error("item_name", "Selected item not found")
                 except Exception as e:
@@ -628,6 +633,7 @@ class OrderForm(forms.ModelForm):
                         item = InventoryItem.objects.get(id=item_id)
                         cleaned["item_name"] = item.name
                         cleaned["brand"] = "Unbranded"
+                        self.inventory_item_id = item.id
                     except InventoryItem.DoesNotExist:
                         self.add_error("item_name", "Selected item not found")
 
@@ -641,8 +647,7 @@ class OrderForm(forms.ModelForm):
             tire_services = cleaned.get("tire_services") or []
             if tire_services:
                 try:
-                    addons = ServiceAddon.objects.filter(name__in=tire_services, is_active=True)
-                    total_minutes = sum(int(a.estimated_minutes or 0) for a in addons)
+                    total_minutes = catalog_minutes(get_service_addons(), tire_services)
                     # If there's already an estimated duration, add to it
                     current_duration = cleaned.get("estimated_duration") or 0
                     try:
@@ -681,8 +686,7 @@ class OrderForm(forms.ModelForm):
             # Calculate estimated duration from selected services
             if services:
                 try:
-                    service_types = ServiceType.objects.filter(name__in=services, is_active=True)
-                    total_minutes = sum(int(s.estimated_minutes or 0) for s in service_types)
+                    total_minutes = catalog_minutes(get_service_types(), services)
                     cleaned["estimated_duration"] = total_minutes
                 except Exception:
                     pass
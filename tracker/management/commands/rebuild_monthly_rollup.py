@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from tracker.models import Customer, MonthlyCustomerTypeRollup
+from tracker.utils import clear_customer_groups_cache, monthly_order_counts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly customer-type order rollup from completed months (schedule nightly)."
+
+    def handle(self, *args, **options):
+        # Only completed months are rolled up; the current month is always aggregated live
+        month_start = timezone.localdate().replace(day=1)
+        customer_types = [code for code, _ in Customer.TYPE_CHOICES]
+
+        rows = [
+            MonthlyCustomerTypeRollup(
+                customer_type=row['customer__customer_type'],
+                month=row['month'],
+                orders=row['orders'],
+                customers=row['customers'],
+            )
+            for row in monthly_order_counts(
+                customer__customer_type__in=customer_types,
+                created_at__date__lt=month_start,
+            )
+        ]
+
+        with transaction.atomic():
+            MonthlyCustomerTypeRollup.objects.all().delete()
+            MonthlyCustomerTypeRollup.objects.bulk_create(rows, batch_size=500)
+        clear_customer_groups_cache()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(rows)} monthly rollup row(s) before {month_start:%Y-%m}."))
@@ -4,6 +4,7 @@ from datetime import timedelta
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from .models import Order
+from .utils import begin_audit_buffer, flush_audit_buffer
 
 class TimezoneMiddleware(MiddlewareMixin):
     def process_request(self, request):
@@ -16,6 +17,15 @@ class TimezoneMiddleware(MiddlewareMixin):
         else:
             timezone.deactivate()
 
+class AuditLogBufferMiddleware(MiddlewareMixin):
+    """Collect audit entries recorded during a request and store them in one cache write."""
+    def process_request(self, request):
+        request._audit_buffer_token = begin_audit_buffer()
+
+    def process_response(self, request, response):
+        flush_audit_buffer(getattr(request, '_audit_buffer_token', None))
+        return response
+
 class AutoProgressOrdersMiddleware(MiddlewareMixin):
     """Automatically progress orders from 'created' to 'in_progress' after 10 minutes
     without requiring users to visit the order page.
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Q
+from django.db.models.functions import Lower, Upper
 from datetime import timedelta
 import uuid
 
@@ -102,6 +103,12 @@ class Customer(models.Model):
             models.Index(fields=["registration_date"], name="idx_cust_reg"),
             models.Index(fields=["last_visit"], name="idx_cust_lastvisit"),
             models.Index(fields=["customer_type"], name="idx_cust_type"),
+            # Customer-group analytics group by type and filter on registration window
+            models.Index(fields=["customer_type", "registration_date"], name="idx_cust_type_reg"),
+            # Duplicate checks filter on exact branch + phone before comparing names
+            models.Index(fields=["branch", "phone"], name="idx_cust_branch_phone"),
+            # full_name__iexact compiles to UPPER(full_name) = UPPER(%s) on PostgreSQL
+            models.Index(Upper("full_name"), name="idx_cust_fullname_upper"),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -201,6 +208,9 @@ class Order(models.Model):
             models.Index(fields=["status"], name="idx_order_status"),
             models.Index(fields=["type"], name="idx_order_type"),
             models.Index(fields=["created_at"], name="idx_order_created"),
+            # Per-customer order subqueries filter by customer and date range
+            models.Index(fields=["customer", "created_at"], name="idx_order_cust_created"),
+            models.Index(fields=["type", "status", "created_at"], name="idx_order_type_status_created"),
         ]
 
     def _generate_order_number(self) -> str:
@@ -372,6 +382,28 @@ class CustomerNote(models.Model):
         return f"Note for {self.customer.full_name} at {timezone.localtime(self.created_at).strftime('%Y-%m-%d %H:%M')}"
 
 
+class MonthlyCustomerTypeRollup(models.Model):
+    """Orders and distinct customers per customer type per completed month.
+
+    Rebuilt by the ``rebuild_monthly_rollup`` management command so the customer
+    groups trend charts do not scan the whole Order table on every request.
+    """
+    customer_type = models.CharField(max_length=20, choices=Customer.TYPE_CHOICES)
+    month = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    customers = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['customer_type', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['customer_type', 'month'], name='uniq_rollup_type_month'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.customer_type} {self.month:%Y-%m}: {self.orders}"
+
+
 class ServiceType(models.Model):
     """Admin-managed service types for 'Service' orders with expected durations."""
     name = models.CharField(max_length=128, unique=True)
@@ -385,6 +417,9 @@ class ServiceType(models.Model):
             models.Index(fields=["name"], name="idx_service_type_name"),
             models.Index(fields=["is_active"], name="idx_service_type_active"),
         ]
+        constraints = [
+            models.UniqueConstraint(Lower("name"), name="svctype_name_ci_uniq"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.name} ({self.estimated_minutes}m)"
@@ -403,6 +438,9 @@ class ServiceAddon(models.Model):
             models.Index(fields=["name"], name="idx_service_addon_name"),
             models.Index(fields=["is_active"], name="idx_service_addon_active"),
         ]
+        constraints = [
+            models.UniqueConstraint(Lower("name"), name="svcaddon_name_ci_uniq"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.name} ({self.estimated_minutes}m)"
@@ -1,7 +1,9 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from .utils import add_audit_log
+from .models import Brand, Customer, InventoryItem, Order, ServiceType, ServiceAddon
+from .utils import add_audit_log, clear_customer_groups_cache, clear_inventory_cache, clear_service_catalog_cache
 
 
 def _client_ip(request):
@@ -32,3 +34,21 @@ def on_user_login_failed(sender, credentials, request, **kwargs):
     ua = (request.META.get('HTTP_USER_AGENT') if request else '') or ''
     ua = ua[:200]
     add_audit_log(None, 'login_failed', f'Username: {username} from {ip or "?"} UA: {ua}')
+
+@receiver([post_save, post_delete], sender=ServiceType)
+@receiver([post_save, post_delete], sender=ServiceAddon)
+@receiver([post_save, post_delete], sender=Brand)
+def on_service_catalog_changed(sender, **kwargs):
+    clear_service_catalog_cache()
+
+
+@receiver([post_save, post_delete], sender=InventoryItem)
+@receiver([post_save, post_delete], sender=Brand)
+def on_inventory_item_changed(sender, **kwargs):
+    clear_inventory_cache()
+
+
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Order)
+def on_customer_activity_changed(sender, **kwargs):
+    clear_customer_groups_cache()
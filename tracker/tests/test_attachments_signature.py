@@ -1,10 +1,16 @@
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 from tracker.models import Order, OrderAttachment, Customer, Branch
 import base64
 import io
+import tempfile
 
 class AttachmentsSignatureTests(TestCase):
     def setUp(self):
@@ -53,3 +59,39 @@ class AttachmentsSignatureTests(TestCase):
         self.assertEqual(resp.status_code, 302)
         o = Order.objects.get(pk=self.order.pk)
         self.assertNotEqual(o.status, 'completed')
+
+
+class CompleteOrderQueryCountTests(TestCase):
+    """complete_order must issue the same number of queries however many attachments it signs."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.client = Client()
+        self.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='pass')
+        self.branch = Branch.objects.create(name='B1', code='B1')
+        self.customer = Customer.objects.create(full_name='John Doe', phone='123', branch=self.branch)
+        self.client.login(username='admin', password='pass')
+
+    def _png(self, color):
+        buf = io.BytesIO()
+        Image.new('RGB', (120, 80), color).save(buf, format='PNG')
+        return buf.getvalue()
+
+    def _complete_with_attachments(self, count):
+        order = Order.objects.create(branch=self.branch, customer=self.customer, type='service', status='in_progress')
+        for i in range(count):
+            OrderAttachment.objects.create(order=order, file=ContentFile(self._png('white'), name=f'photo{i}.png'))
+        signature = 'data:image/png;base64,' + base64.b64encode(self._png('black')).decode()
+        url = reverse('tracker:complete_order', kwargs={'pk': order.pk})
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(url, {'signature_data': signature})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(OrderAttachment.objects.filter(order=order, title__endswith='(Signed)').count(), count)
+        return len(queries)
+
+    def test_query_count_is_independent_of_attachment_count(self):
+        self.assertEqual(self._complete_with_attachments(1), self._complete_with_attachments(5))
@@ -7,9 +7,14 @@ from __future__ import annotations
 import os
 import base64
 import json
+from contextvars import ContextVar
+from functools import lru_cache
 from urllib import request, parse
 
+import orjson
+
 from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 
 
@@ -69,6 +74,20 @@ def send_sms(phone: str, message: str) -> tuple[bool, str]:
 
 # ---- Audit log helpers ----------------------------------------------------
 
+AUDIT_LOG_KEY = 'audit_logs'
+AUDIT_LOG_LIMIT = 500
+
+# Entries recorded while a request is being handled; AuditLogBufferMiddleware
+# opens the buffer and writes it to the cache once when the response is ready.
+_audit_buffer: ContextVar[list | None] = ContextVar('audit_buffer', default=None)
+
+
+def _write_audit_entries(entries: list) -> None:
+    logs = cache.get(AUDIT_LOG_KEY, []) or []
+    logs.extend(entries)
+    cache.set(AUDIT_LOG_KEY, logs[-AUDIT_LOG_LIMIT:], None)
+
+
 def add_audit_log(user=None, action: str | None = None, details: str | None = None, **kwargs) -> None:
     """Record an audit entry in cache.
     Accepts flexible arguments:
@@ -76,9 +95,9 @@ def add_audit_log(user=None, action: str | None = None, details: str | None = No
       - details or description
       - ip (optional)
       - any extra metadata via kwargs stored under 'meta'
+    Inside a request the entry is buffered and flushed with the others at response time.
     """
     try:
-        logs = cache.get('audit_logs', []) or []
         action_val = action or kwargs.pop('action_type', None) or ''
         description_val = (kwargs.pop('description', None) or details or '')
         ip = kwargs.pop('ip', None)
@@ -94,21 +113,49 @@ def add_audit_log(user=None, action: str | None = None, details: str | None = No
             entry['ip'] = ip
         if meta:
             entry['meta'] = meta
-        logs.append(entry)
-        logs = logs[-500:]
-        cache.set('audit_logs', logs, None)
+        buffer = _audit_buffer.get()
+        if buffer is not None:
+            buffer.append(entry)
+        else:
+            _write_audit_entries([entry])
     except Exception:
         # Avoid breaking user flows on logging errors
         pass
 
 
+def begin_audit_buffer():
+    """Start buffering audit entries for the current request; returns a reset token."""
+    return _audit_buffer.set([])
+
+
+def flush_audit_buffer(token=None) -> None:
+    """Write buffered audit entries in a single cache round trip and close the buffer."""
+    entries = _audit_buffer.get()
+    try:
+        _audit_buffer.reset(token)
+    except (TypeError, ValueError):
+        # No token, or one created in a different context
+        _audit_buffer.set(None)
+    if entries:
+        try:
+            _write_audit_entries(entries)
+        except Exception:
+            pass
+
+
 def get_audit_logs() -> list:
-    logs = cache.get('audit_logs', []) or []
+    logs = cache.get(AUDIT_LOG_KEY, []) or []
+    pending = _audit_buffer.get()
+    if pending:
+        logs = (logs + pending)[-AUDIT_LOG_LIMIT:]
     return list(reversed(logs))
 
 
 def clear_audit_logs() -> None:
-    cache.delete('audit_logs')
+    cache.delete(AUDIT_LOG_KEY)
+    pending = _audit_buffer.get()
+    if pending:
+        pending.clear()
 
 
 # ---- Branch scoping helpers ----------------------------------------------
@@ -122,47 +169,93 @@ def get_user_branch(user):
         return None
 
 
+@lru_cache(maxsize=None)
+def _model_has_branch(model) -> bool:
+    return any(f.name == 'branch' for f in model._meta.fields)
+
+
+def _resolve_scope(user, request=None) -> tuple[bool, int | None]:
+    """Return (restrict, branch_id) for user; restrict with no branch id means no rows."""
+    # Superusers: allow optional branch filter via querystring
+    if getattr(user, 'is_superuser', False):
+        if request:
+            b_id = request.GET.get('branch')
+            if b_id:
+                b_id = b_id.strip()
+                if b_id.isdigit():
+                    return True, int(b_id)
+                # Try resolving by exact name (case-insensitive)
+                from ..models import Branch as _Branch
+                try:
+                    bobj_id = _Branch.objects.filter(name__iexact=b_id).values_list('id', flat=True).first()
+                    if bobj_id:
+                        return True, bobj_id
+                except Exception:
+                    pass
+        return False, None
+    # Staff/regular users: restrict to their assigned branch
+    b = get_user_branch(user)
+    return True, (b.id if b else None)
+
+
 def scope_queryset(qs, user, request=None):
     """Scope a queryset to the user's branch unless superuser.
     If admin passes ?branch=<id>, use that branch.
     Applies only if model has a 'branch' field.
+    The branch resolution is memoized on the request, so repeated calls in one view are cheap.
     """
     try:
-        model = qs.model
-        branch_field = next((f for f in model._meta.fields if f.name == 'branch'), None)
-        if not branch_field:
+        if not _model_has_branch(qs.model):
             return qs
-        # Superusers: allow optional branch filter via querystring
-        if getattr(user, 'is_superuser', False):
-            if request:
-                b_id = request.GET.get('branch')
-                if b_id:
-                    b_id = b_id.strip()
-                    if b_id.isdigit():
-                        return qs.filter(branch_id=int(b_id))
-                    # Try resolving by exact name (case-insensitive)
-                    from .models import Branch as _Branch
-                    try:
-                        bobj = _Branch.objects.filter(name__iexact=b_id).first()
-                        if bobj:
-                            return qs.filter(branch_id=bobj.id)
-                    except Exception:
-                        pass
+        memo = getattr(request, '_scope_cache', None)
+        if memo is None:
+            memo = {}
+            if request is not None:
+                request._scope_cache = memo
+        key = getattr(user, 'pk', None)
+        if key not in memo:
+            memo[key] = _resolve_scope(user, request)
+        restrict, branch_id = memo[key]
+        if not restrict:
             return qs
-        # Staff/regular users: restrict to their assigned branch
-        b = get_user_branch(user)
-        if b:
-            return qs.filter(branch=b)
-        return qs.none()
+        if branch_id is None:
+            return qs.none()
+        return qs.filter(branch_id=branch_id)
     except Exception:
         return qs
 
 # ---- Inventory helpers ----------------------------------------------------
 
+REGISTRATION_ITEMS_CACHE_KEY = 'reg_inv_items_v1'
+REGISTRATION_ITEMS_TTL = 120
+
+
+def _build_registration_items() -> tuple[list[dict], str]:
+    from ..models import InventoryItem
+    qs = (
+        InventoryItem.objects.filter(is_active=True, brand__isnull=False)
+        .order_by('brand__name', 'name')
+        .values('id', 'name', 'quantity', 'brand__name')
+    )
+    rows, item_data = [], {}
+    # Stream in chunks instead of filling the queryset result cache first
+    for row in qs.iterator(chunk_size=500):
+        rows.append(row)
+        if row['name'] and row['brand__name']:
+            item_data[str(row['id'])] = {'name': row['name'], 'brand': row['brand__name'], 'quantity': row['quantity']}
+    return rows, orjson.dumps(item_data).decode()
+
+
+def get_registration_items() -> tuple[list[dict], str]:
+    """Return (active branded item rows, pre-serialized item_data JSON) for the registration form."""
+    return cache.get_or_set(REGISTRATION_ITEMS_CACHE_KEY, _build_registration_items, REGISTRATION_ITEMS_TTL)
+
+
 def clear_inventory_cache(name: str | None = None, brand: str | None = None) -> None:
     try:
         cache.delete('api_inv_items_v1')
         cache.delete('dashboard_metrics_v1')
+        cache.delete(REGISTRATION_ITEMS_CACHE_KEY)
         if name:
             cache.delete(f'api_inv_brands_{name}')
             # Invalidate stock caches for specific brand, unbranded alias, and any-brand aggregate
@@ -175,9 +268,31 @@ def clear_inventory_cache(name: str | None = None, brand: str | None = None) ->
         pass
 
 
+def _apply_inventory_delta(qs, qty_delta: int) -> tuple[bool, str, int | None]:
+    """Apply qty_delta to the first InventoryItem matched by qs with a single guarded UPDATE.
+    Deductions only match a row that still holds enough stock, so concurrent sales cannot oversell.
+    """
+    from django.db.models import F
+    qty_delta = int(qty_delta)
+    # Resolve exactly one row; a name+brand lookup may match several items
+    pk = qs.order_by('pk').values_list('pk', flat=True).first()
+    if pk is None:
+        return False, 'not_found', None
+    target = qs.model.objects.filter(pk=pk)
+    guarded = target.filter(quantity__gte=-qty_delta) if qty_delta < 0 else target
+    if not guarded.update(quantity=F('quantity') + qty_delta):
+        return False, ('insufficient_stock' if target.exists() else 'not_found'), None
+    row = target.values_list('quantity', 'name', 'brand__name').first()
+    if row is None:
+        return False, 'not_found', None
+    new_qty, name, brand = row
+    clear_inventory_cache(name, brand or 'Unbranded')
+    return True, 'ok', new_qty
+
+
 def adjust_inventory(name: str, brand: str, qty_delta: int) -> tuple[bool, str, int | None]:
     """Adjust inventory by name+brand with qty_delta (negative to deduct, positive to restock).
-    Returns (ok, status, remaining_qty). status in {ok, not_found, invalid}.
+    Returns (ok, status, remaining_qty). status in {ok, not_found, insufficient_stock, invalid}.
     """
     try:
         # Import from the parent app package (not from inside utils)
@@ -186,16 +301,135 @@ def adjust_inventory(name: str, brand: str, qty_delta: int) -> tuple[bool, str,
         brand = (brand or '').strip()
         if not name:
             return False, 'invalid', None
-        # Resolve by brand name (case-insensitive)
-        item = InventoryItem.objects.filter(name=name, brand__name__iexact=brand).first()
-        if not item:
-            return False, 'not_found', None
-        new_qty = item.quantity + int(qty_delta)
-        if new_qty < 0:
-            new_qty = 0
-        item.quantity = new_qty
-        item.save()
-        clear_inventory_cache(name, brand)
-        return True, 'ok', new_qty
+        # Resolve by brand name (case-insensitive); the savepoint keeps a failed update
+        # from aborting a caller's surrounding transaction
+        with transaction.atomic():
+            return _apply_inventory_delta(InventoryItem.objects.filter(name=name, brand__name__iexact=brand), qty_delta)
     except Exception as e:
         return False, str(e), None
+
+
+def adjust_inventory_by_id(pk, qty_delta: int) -> tuple[bool, str, int | None]:
+    """Adjust an already-resolved InventoryItem by primary key, skipping the name+brand lookup.
+    Same return contract as adjust_inventory.
+    """
+    try:
+        from ..models import InventoryItem  # type: ignore
+        with transaction.atomic():
+            return _apply_inventory_delta(InventoryItem.objects.filter(pk=pk), qty_delta)
+    except Exception as e:
+        return False, str(e), None
+
+
+# ---- Service catalog helpers ---------------------------------------------
+
+SERVICE_TYPES_CACHE_KEY = 'service_types_active_v1'
+SERVICE_ADDONS_CACHE_KEY = 'service_addons_active_v1'
+ACTIVE_BRANDS_CACHE_KEY = 'active_brands_list'
+SERVICE_CATALOG_TTL = 600
+# Bumped whenever the catalog changes; keys the rendered catalog template fragments
+SERVICE_CATALOG_VERSION_KEY = 'service_catalog_version'
+
+
+def _active_catalog(model) -> list[dict]:
+    rows = model.objects.filter(is_active=True).order_by('name').values_list('name', 'estimated_minutes')
+    return [{'name': name, 'estimated_minutes': int(minutes or 0)} for name, minutes in rows]
+
+
+def get_service_types() -> list[dict]:
+    """Return active service types as [{name, estimated_minutes}], cached until one changes."""
+    from ..models import ServiceType
+    return cache.get_or_set(SERVICE_TYPES_CACHE_KEY, lambda: _active_catalog(ServiceType), SERVICE_CATALOG_TTL)
+
+
+def get_service_addons() -> list[dict]:
+    """Return active sales add-ons as [{name, estimated_minutes}], cached until one changes."""
+    from ..models import ServiceAddon
+    return cache.get_or_set(SERVICE_ADDONS_CACHE_KEY, lambda: _active_catalog(ServiceAddon), SERVICE_CATALOG_TTL)
+
+
+def catalog_minutes(catalog: list[dict], names) -> int:
+    """Total estimated_minutes of the entries named in names, from a cached catalog list."""
+    wanted = set(names)
+    return sum(entry['estimated_minutes'] for entry in catalog if entry['name'] in wanted)
+
+
+def get_service_catalog() -> tuple[list[dict], list[dict]]:
+    """Return (service types, sales add-ons) with a single cache round trip for both lists."""
+    cached = cache.get_many([SERVICE_TYPES_CACHE_KEY, SERVICE_ADDONS_CACHE_KEY])
+    if SERVICE_TYPES_CACHE_KEY in cached and SERVICE_ADDONS_CACHE_KEY in cached:
+        return cached[SERVICE_TYPES_CACHE_KEY], cached[SERVICE_ADDONS_CACHE_KEY]
+    from ..models import ServiceType, ServiceAddon
+    missing = {}
+    if SERVICE_TYPES_CACHE_KEY not in cached:
+        missing[SERVICE_TYPES_CACHE_KEY] = _active_catalog(ServiceType)
+    if SERVICE_ADDONS_CACHE_KEY not in cached:
+        missing[SERVICE_ADDONS_CACHE_KEY] = _active_catalog(ServiceAddon)
+    cache.set_many(missing, SERVICE_CATALOG_TTL)
+    cached.update(missing)
+    return cached[SERVICE_TYPES_CACHE_KEY], cached[SERVICE_ADDONS_CACHE_KEY]
+
+
+def get_active_brands() -> list[dict]:
+    """Return active brands as [{id, name}] ordered by name, cached until one changes."""
+    from ..models import Brand
+    return cache.get_or_set(
+        ACTIVE_BRANDS_CACHE_KEY,
+        lambda: list(Brand.objects.filter(is_active=True).order_by('name').values('id', 'name')),
+        SERVICE_CATALOG_TTL,
+    )
+
+
+def service_catalog_version() -> int:
+    """Current catalog version, used as the vary-on value of cached catalog fragments."""
+    return cache.get_or_set(SERVICE_CATALOG_VERSION_KEY, lambda: int(timezone.now().timestamp()), None)
+
+
+def clear_service_catalog_cache() -> None:
+    try:
+        cache.delete_many([SERVICE_TYPES_CACHE_KEY, SERVICE_ADDONS_CACHE_KEY, ACTIVE_BRANDS_CACHE_KEY])
+    except Exception:
+        pass
+    try:
+        cache.incr(SERVICE_CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(SERVICE_CATALOG_VERSION_KEY, int(timezone.now().timestamp()), None)
+    except Exception:
+        pass
+
+
+# ---- Customer groups analytics cache ---------------------------------------
+CUSTOMER_GROUPS_VERSION_KEY = 'cgroups_version'
+CUSTOMER_GROUPS_TTL = 300
+
+
+def _fresh_customer_groups_version() -> int:
+    # Seeded from the clock so an evicted counter never reuses an older version number
+    return int(timezone.now().timestamp())
+
+
+def customer_groups_cache_key(*parts) -> str:
+    """Build a versioned customer-groups cache key; bumping the version orphans every entry."""
+    version = cache.get_or_set(CUSTOMER_GROUPS_VERSION_KEY, _fresh_customer_groups_version, None)
+    return 'cgroups:{}:{}'.format(version, ':'.join(str(p) for p in parts))
+
+
+def clear_customer_groups_cache() -> None:
+    try:
+        cache.incr(CUSTOMER_GROUPS_VERSION_KEY)
+    except ValueError:
+        cache.set(CUSTOMER_GROUPS_VERSION_KEY, _fresh_customer_groups_version(), None)
+    except Exception:
+        pass
+
+
+def monthly_order_counts(**filters):
+    """Order and distinct-customer counts grouped by (customer type, month) for the given Order filters."""
+    from django.db.models import Count, DateField
+    from django.db.models.functions import TruncMonth
+    from ..models import Order
+    return (Order.objects.filter(**filters)
+            .annotate(month=TruncMonth('created_at', output_field=DateField()))
+            .values('customer__customer_type', 'month')
+            .annotate(orders=Count('id'), customers=Count('customer', distinct=True))
+            .order_by('customer__customer_type', 'month'))
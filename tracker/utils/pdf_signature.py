@@ -3,7 +3,7 @@ from __future__ import annotations
 import math
 from io import BytesIO
 from pathlib import Path
-from typing import Tuple, Optional, Dict, Any
+from typing import BinaryIO, Tuple, Optional, Dict, Any, Union
 
 from PIL import Image, ImageOps, ImageFilter, ImageEnhance
 from PyPDF2 import PdfReader, PdfWriter
@@ -15,6 +15,22 @@ class SignatureEmbedError(Exception):
     """Raised when a signature cannot be embedded into the provided PDF."""
 
 
+def _source_stream(source: Union[bytes, BinaryIO], empty_message: str) -> BinaryIO:
+    """Binary stream for bytes or an open file-like document, rewound to the start.
+    File-like sources are read lazily by PyPDF2/PIL instead of being copied into memory first."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if not source:
+            raise SignatureEmbedError(empty_message)
+        return BytesIO(source)
+    if source is None:
+        raise SignatureEmbedError(empty_message)
+    try:
+        source.seek(0)
+    except (AttributeError, OSError, ValueError):
+        pass
+    return source
+
+
 def _scale_dimensions(
     page_width: float,
     page_height: float,
@@ -131,7 +147,7 @@ def _enhance_signature_for_pen_effect(signature_image: Image.Image) -> Image.Ima
 
 
 def embed_signature_in_pdf(
-    pdf_bytes: bytes,
+    pdf_bytes: Union[bytes, BinaryIO],
     signature_bytes: bytes,
     *,
     position_type: str = "customer",
@@ -140,14 +156,13 @@ def embed_signature_in_pdf(
     max_height_ratio: float = 0.12,
     preset: Optional[str] = None,
 ) -> bytes:
-    """Return a PDF with blue ink signature embedded."""
-    if not pdf_bytes:
-        raise SignatureEmbedError("No PDF content provided.")
+    """Return a PDF with blue ink signature embedded. pdf_bytes may also be an open binary file."""
+    pdf_stream = _source_stream(pdf_bytes, "No PDF content provided.")
     if not signature_bytes:
         raise SignatureEmbedError("No signature content provided.")
 
     try:
-        reader = PdfReader(BytesIO(pdf_bytes))
+        reader = PdfReader(pdf_stream)
     except Exception as exc:
         raise SignatureEmbedError("Could not read the provided PDF document.") from exc
 
@@ -230,7 +245,7 @@ def embed_signature_in_pdf(
 
 
 def embed_signature_in_image(
-    image_bytes: bytes,
+    image_bytes: Union[bytes, BinaryIO],
     signature_bytes: bytes,
     *,
     position_type: str = "customer",
@@ -240,14 +255,13 @@ def embed_signature_in_image(
     output_format: Optional[str] = None,
     preset: Optional[str] = None,
 ) -> bytes:
-    """Overlay blue ink signature onto the image."""
-    if not image_bytes:
-        raise SignatureEmbedError("No image content provided.")
+    """Overlay blue ink signature onto the image. image_bytes may also be an open binary file."""
+    image_stream = _source_stream(image_bytes, "No image content provided.")
     if not signature_bytes:
         raise SignatureEmbedError("No signature content provided.")
 
     try:
-        base_img = Image.open(BytesIO(image_bytes))
+        base_img = Image.open(image_stream)
     except Exception as exc:
         raise SignatureEmbedError("Could not read the provided image document.") from exc
 
@@ -1,31 +1,36 @@
 import json
+import logging
+from functools import lru_cache
 from django import http
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpRequest, HttpResponse
+from django.http import JsonResponse, HttpRequest, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
-from django.db.models import Count, Avg, Q, Sum, Case, When, F, Value, DecimalField, ExpressionWrapper
-from django.db.models.functions import TruncDate, TruncDay, TruncMonth, Concat
+from django.db.models import Count, Avg, Q, Sum, Case, When, F, Value, DecimalField, ExpressionWrapper, IntegerField, OuterRef, Subquery, Prefetch
+from django.db.models.functions import TruncDate, TruncDay, Concat, Length, Replace, Coalesce
 from django.utils import timezone
 from django.template.loader import render_to_string
 from django.contrib.auth.views import LoginView
 from datetime import timedelta
 from .forms import ProfileForm, CustomerStep1Form, CustomerStep2Form, CustomerStep3Form, CustomerStep4Form, VehicleForm, OrderForm, CustomerEditForm, SystemSettingsForm, BrandForm
-from django.urls import reverse
+from django.urls import reverse, get_script_prefix
 from django.contrib import messages
 from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
 from django.core.files.base import ContentFile
 import base64
 import json
+import os
+import re
 import time
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User, Group
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.core.exceptions import ValidationError
-from .models import Profile, Customer, Order, Vehicle, InventoryItem, CustomerNote, Brand, Branch, OrderAttachment, ServiceType, ServiceAddon
+from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
+from .models import Profile, Customer, Order, Vehicle, InventoryItem, CustomerNote, Brand, Branch, OrderAttachment, ServiceType, ServiceAddon, MonthlyCustomerTypeRollup
 from django.core.paginator import Paginator
-from .utils import add_audit_log, get_audit_logs, clear_audit_logs, scope_queryset, get_user_branch
+from .utils import add_audit_log, get_audit_logs, clear_audit_logs, scope_queryset, get_user_branch, get_service_types, get_service_addons, get_service_catalog, catalog_minutes, service_catalog_version, get_active_brands, get_registration_items, adjust_inventory, adjust_inventory_by_id, clear_inventory_cache, customer_groups_cache_key, CUSTOMER_GROUPS_TTL, monthly_order_counts
 from .utils.pdf_signature import (
     embed_signature_in_pdf,
     SignatureEmbedError,
@@ -33,13 +38,233 @@ from .utils.pdf_signature import (
     embed_signature_in_image,
     build_signed_name,
 )
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import orjson
 
 
 
 from django.contrib.auth.views import LogoutView
 from django.views.generic import View
 
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj) -> str:
+    """Serialize obj to a JSON string for embedding into templates."""
+    return orjson.dumps(obj, default=str).decode()
+
+
+class OrjsonResponse(HttpResponse):
+    """JSON response encoded with orjson; a drop-in for JsonResponse(dict)."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(orjson.dumps(data, default=str), **kwargs)
+
+
+_NON_DIGIT_RE = re.compile(r'\D')
+
+# Customer type code -> display name; TYPE_CHOICES is a class constant
+_CUSTOMER_TYPE_DICT = dict(Customer.TYPE_CHOICES)
+
+# Separators commonly typed into phone numbers; stripped in SQL for duplicate checks
+_PHONE_SEPARATORS = (' ', '-', '+', '(', ')', '.', '/')
+
+# Upload rules for order completion documents, signatures and attachments
+_IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.webp'})
+_ALLOWED_ATTACHMENT_EXTS = _IMAGE_EXTS | {'.pdf', '.doc', '.docx', '.xls', '.xlsx', '.txt'}
+_ALLOWED_SIGNATURE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+_MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024  # 10 MB
+_MAX_SIGNATURE_BYTES = 2 * 1024 * 1024  # 2 MB
+
+
+def _ext_of_name(name):
+    """Lower-cased extension of a file name including the dot, or '' when it has none."""
+    return os.path.splitext(name or '')[1].lower()
+
+
+# Non-ISO date formats accepted from report filters, tried after fromisoformat
+_USER_DATE_FORMATS = ('%d/%m/%Y', '%m/%d/%Y')
+
+
+def _parse_user_date(value):
+    """Parse a user-entered filter date; ISO first, then the local formats. None if unparseable."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        pass
+    for fmt in _USER_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _deferred_file_save(instance, field_name, filename, data):
+    """Reserve the final storage name for a file field without writing it yet.
+
+    Returns a callable that writes data under that name; if storage had to pick another
+    name by then, the row is re-pointed at it.
+    """
+    field_file = getattr(instance, field_name)
+    field = field_file.field
+    name = field.generate_filename(instance, filename)
+    field_file.name = field_file.storage.get_available_name(name, max_length=field.max_length)
+    reserved = field_file.name
+
+    def write():
+        saved = field_file.storage.save(reserved, ContentFile(data), max_length=field.max_length)
+        if saved != reserved:
+            type(instance)._default_manager.filter(pk=instance.pk).update(**{field_name: saved})
+
+    return write
+
+
+class _Echo:
+    """Pseudo-buffer that hands each csv.writer row back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _filter_similar_phone(qs, normalized_phone):
+    """Narrow a Customer queryset to rows whose digits-only phone overlaps normalized_phone.
+
+    A match is an exact or partial (substring either way) match of at least 6 digits,
+    evaluated by the database so only matching rows are returned.
+    """
+    digits = F('phone')
+    for sep in _PHONE_SEPARATORS:
+        digits = Replace(digits, Value(sep), Value(''))
+    return (
+        qs.annotate(phone_digits=digits, phone_probe=Value(normalized_phone))
+        .annotate(phone_digits_len=Length('phone_digits'))
+        .filter(phone_digits_len__gte=6)
+        .filter(Q(phone_digits__contains=normalized_phone) | Q(phone_probe__contains=F('phone_digits')))
+    )
+
+
+def _find_duplicate(full_name, phone, user, branch):
+    """Find a same-name customer in branch whose phone matches at least 6 digits.
+
+    Returns (customer_or_none, cross_branch). cross_branch is True when the match
+    is not accessible to user, in which case a separate record may be created.
+    """
+    normalized_phone = _NON_DIGIT_RE.sub('', phone) if phone else ''
+    if len(normalized_phone) < 6:
+        return None, False
+    # Re-entering a known customer usually repeats the exact phone: probe the
+    # (branch, phone) index before the case-insensitive name scan
+    wanted_name = (full_name or '').casefold()
+    exact = Customer.objects.filter(branch=branch, phone=phone).only('id', 'full_name', 'phone', 'branch_id')
+    customer = next((c for c in exact if c.full_name.casefold() == wanted_name), None)
+    if customer is None:
+        customer = _filter_similar_phone(
+            Customer.objects.filter(full_name__iexact=full_name, branch=branch).only('id', 'full_name', 'phone', 'branch_id'),
+            normalized_phone,
+        ).first()
+    if customer is None:
+        return None, False
+    can_access = getattr(user, 'is_superuser', False) or (branch is not None and customer.branch_id == branch.id)
+    return customer, not can_access
+
+
+# Customer fields collected by the registration wizard (step 1)
+_REGISTRATION_CUSTOMER_FIELDS = (
+    'full_name', 'phone', 'whatsapp', 'email', 'address', 'notes',
+    'customer_type', 'organization_name', 'tax_number', 'personal_subtype',
+)
+
+
+_PK_PLACEHOLDER = 987654321
+
+
+@lru_cache(maxsize=32)
+def _detail_url_template(name, script_prefix):
+    return reverse(name, kwargs={'pk': _PK_PLACEHOLDER}).replace(str(_PK_PLACEHOLDER), '{pk}')
+
+
+def _detail_url(name, pk):
+    """reverse(name, kwargs={'pk': pk}) for <int:pk> routes, resolving each route once per script prefix."""
+    return _detail_url_template(name, get_script_prefix()).format(pk=int(pk))
+
+# Wizard state kept in the session, one key per completed step
+_REGISTRATION_SESSION_KEYS = ("reg_step1", "reg_step2", "reg_step3")
+
+
+def _create_customer(data, branch, **overrides):
+    """Insert a new Customer for branch from registration data.
+
+    Keyword overrides replace the matching values taken from data.
+    """
+    fields = {name: data.get(name) for name in _REGISTRATION_CUSTOMER_FIELDS}
+    fields.update(overrides)
+    customer = Customer(branch=branch, **fields)
+    customer.save(force_insert=True)
+    return customer
+
+
+def _service_catalog_context():
+    """Template context with the cached service types and sales add-ons (empty lists if unavailable).
+    catalog_version keys the cached catalog fragments in the order form templates."""
+    try:
+        service_types, sales_addons = get_service_catalog()
+        catalog_version = service_catalog_version()
+    except Exception:
+        logger.warning("Service catalog unavailable", exc_info=True)
+        service_types, sales_addons, catalog_version = [], [], None
+    return {'service_types': service_types, 'sales_addons': sales_addons, 'catalog_version': catalog_version}
+
+
+def _order_base_qs(request, fields=None):
+    """Orders visible to the requesting user, limited to the given columns when fields is set."""
+    qs = scope_queryset(Order.objects.all(), request.user, request)
+    return qs.only(*fields) if fields else qs
+
+
+def _order_vehicle(customer, plate_number, make, model, vehicle_type):
+    """Vehicle for the new-vehicle fields of an order form. A plate the customer already has
+    reuses that vehicle instead of inserting a duplicate row; without a plate a new one is created."""
+    details = {'make': make or None, 'model': model or None, 'vehicle_type': vehicle_type or None}
+    if plate_number:
+        vehicle = Vehicle.objects.filter(customer=customer, plate_number=plate_number).order_by('pk').first()
+        if vehicle is not None:
+            return vehicle
+    return Vehicle.objects.create(customer=customer, plate_number=plate_number or None, **details)
+
+
+class _SaleRejected(Exception):
+    """Aborts the step-4 registration transaction when a sale can't be fulfilled."""
+
+    def __init__(self, message, ajax_message=None):
+        super().__init__(message)
+        self.ajax_message = ajax_message or message
+
+
+# Step-4 OrderForm initial values per order type: (form field, step-3 session keys in priority order)
+_ORDER_INITIAL_MAP = {
+    'service': (
+        ('service_selection', ('service_selection', 'service_type')),
+        ('description', ('description',)),
+        ('estimated_duration', ('estimated_duration',)),
+    ),
+    'sales': (
+        ('item_name', ('item_id',)),
+        ('quantity', ('quantity',)),
+        ('tire_type', ('tire_type',)),
+        ('brand', ('brand',)),
+        ('description', ('description',)),
+    ),
+    'inquiry': (
+        ('priority', ('priority',)),
+        ('inquiry_type', ('inquiry_type',)),
+        ('questions', ('questions',)),
+        ('contact_preference', ('contact_preference',)),
+        ('follow_up_date', ('followup_date', 'follow_up_date')),
+    ),
+}
+
 
 def _mark_overdue_orders(hours=24):
     try:
@@ -704,67 +929,6 @@ def api_customers_summary(request: HttpRequest):
     return JsonResponse({'success': True, 'customers': payload})
 
 
-@login_required
-def customer_detail(request: HttpRequest, pk: int):
-    customers_qs = scope_queryset(Customer.objects.all(), request.user, request)
-    c = get_object_or_404(customers_qs, pk=pk)
-    vehicles = c.vehicles.all()
-    orders = c.orders.order_by("-created_at")[:20]
-
-    # Flash info when redirected from registration duplicate detection
-    if request.GET.get('flash') == 'existing_customer':
-        messages.info(request, f"Customer '{c.full_name}' already exists. You have been redirected to their profile.")
-
-    # Charts: last 6 months order trend and status distribution
-    from django.db.models import Count
-    from django.db.models.functions import TruncMonth
-    from calendar import month_abbr
-
-    today = timezone.localdate().replace(day=1)
-    months = []
-    m_ptr = today
-    for _ in range(6):
-        months.append(m_ptr)
-        # move back one month safely
-        prev = (m_ptr - timezone.timedelta(days=1)).replace(day=1)
-        m_ptr = prev
-    months = list(reversed(months))
-
-    month_counts_qs = (
-        scope_queryset(Order.objects.filter(customer=c), request.user, request)
-        .annotate(m=TruncMonth("created_at"))
-        .values("m")
-        .annotate(c=Count("id"))
-    )
-    month_map = {row["m"].date(): row["c"] for row in month_counts_qs if row["m"]}
-    cd_trend = {
-        "labels": [f"{month_abbr[m.month]} {m.year}" for m in months],
-        "values": [month_map.get(m, 0) for m in months],
-    }
-
-    status_qs = (
-        scope_queryset(Order.objects.filter(customer=c), request.user, request)
-        .values("status")
-        .annotate(c=Count("id"))
-    )
-    status_labels = []
-    status_values = []
-    for row in status_qs:
-        label = (row["status"] or "").replace("_", " ").title()
-        status_labels.append(label or "Unknown")
-        status_values.append(row["c"])
-    cd_status = {"labels": status_labels, "values": status_values}
-
-    return render(request, "tracker/customer_detail.html", {
-        'customer': c,
-        'vehicles': vehicles,
-        'orders': orders,
-        'page_title': c.full_name,
-        'cd_trend': json.dumps(cd_trend),
-        'cd_status': json.dumps(cd_status),
-    })
-
-
 @login_required
 def add_customer_note(request: HttpRequest, pk: int):
     """Add or update a note on a customer's profile"""
@@ -789,14 +953,14 @@ def add_customer_note(request: HttpRequest, pk: int):
                     )
                     action = 'added'
                 
-                # Log the action
-                add_audit_log(
+                # Log the action once the note write has committed
+                transaction.on_commit(lambda: add_audit_log(
                     user=request.user,
                     action_type=f'customer_note_{action}',
                     description=f'{action.capitalize()} a note for customer {customer.full_name}',
                     customer_id=customer.id,
                     note_id=note.id
-                )
+                ))
                 
                 messages.success(request, f'Note {action} successfully.')
             except Exception as e:
@@ -812,27 +976,28 @@ def delete_customer_note(request: HttpRequest, customer_id: int, note_id: int):
     """Delete a customer note"""
     if request.method == 'POST':
         try:
-            note = get_object_or_404(CustomerNote, id=note_id, customer_id=customer_id)
+            note = get_object_or_404(CustomerNote.objects.select_related('customer'), id=note_id, customer_id=customer_id)
+            customer_name = note.customer.full_name
             
-            # Log the action before deletion
-            add_audit_log(
+            note.delete()
+
+            # Log the action once the deletion has committed
+            transaction.on_commit(lambda: add_audit_log(
                 user=request.user,
                 action_type='customer_note_deleted',
-                description=f'Deleted a note for customer {note.customer.full_name}',
+                description=f'Deleted a note for customer {customer_name}',
                 customer_id=customer_id,
                 note_id=note_id
-            )
-            
-            note.delete()
-            return JsonResponse({'success': True})
+            ))
+            return OrjsonResponse({'success': True})
             
         except Exception as e:
-            return JsonResponse(
+            return OrjsonResponse(
                 {'success': False, 'error': str(e)}, 
                 status=400
             )
     
-    return JsonResponse(
+    return OrjsonResponse(
         {'success': False, 'error': 'Invalid request method'}, 
         status=405
     )
@@ -844,45 +1009,19 @@ def customer_register(request: HttpRequest):
     step = int(request.POST.get("step", request.GET.get("step", 1)))
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     load_step = request.GET.get('load_step') == '1'  # Check if this is a step load request
+    user_branch = get_user_branch(request.user)
     
     def get_form_errors(form):
-        errors = {}
-        for field in form:
-            if field.errors:
-                errors[field.name] = [str(error) for error in field.errors]
-        return errors
+        return {
+            name: [str(error) for error in errors]
+            for name, errors in form.errors.items()
+            if name != NON_FIELD_ERRORS
+        }
     
     def get_template_context(step, form, **kwargs):
-        # Get inventory items for new single dropdown system
-        inventory_items = InventoryItem.objects.select_related('brand').filter(is_active=True, brand__isnull=False).order_by('brand__name', 'name')
+        # Inventory rows for the item dropdown plus their JSON mapping for JavaScript (cached)
+        inventory_items, item_data_json = get_registration_items()
         
-        # Build item data mapping for JavaScript
-        item_data = {}
-        for item in inventory_items:
-            if item.name and item.brand:
-                item_data[str(item.id)] = {
-                    'name': item.name,
-                    'brand': item.brand.name,
-                    'quantity': item.quantity
-                }
-        
-        # Load dynamic service types and sales add-ons for steps that need them
-        try:
-            from .models import ServiceType, ServiceAddon
-            svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-            addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-            service_types = [{
-                'name': s.name,
-                'estimated_minutes': int(s.estimated_minutes or 0)
-            } for s in svc_qs]
-            sales_addons = [{
-                'name': a.name,
-                'estimated_minutes': int(a.estimated_minutes or 0)
-            } for a in addon_qs]
-        except Exception:
-            service_types = []
-            sales_addons = []
-
         context = {
             'step': step,
             'form': form,
@@ -891,11 +1030,11 @@ def customer_register(request: HttpRequest):
             'step2': request.session.get('reg_step2', {}),
             'step3': request.session.get('reg_step3', {}),
             'today': timezone.now().date(),
-            'brands': Brand.objects.filter(is_active=True),
+            'brands': get_active_brands(),
             'inventory_items': inventory_items,
-            'item_data_json': json.dumps(item_data),
-            'service_types': service_types,
-            'sales_addons': sales_addons,
+            'item_data_json': item_data_json,
+            # Dynamic service types and sales add-ons for steps that need them
+            **_service_catalog_context(),
             'service_offers': [
                 'Oil Change', 'Engine Diagnostics', 'Brake Repair', 'Tire Rotation',
                 'Wheel Alignment', 'Battery Check', 'Fluid Top-Up', 'General Maintenance'
@@ -916,7 +1055,7 @@ def customer_register(request: HttpRequest):
     
     def render_form(step, form, **kwargs):
         context = get_template_context(step, form, **kwargs)
-        return render(request, 'tracker/partials/customer_registration_form.html', context)
+        return render_to_string('tracker/partials/customer_registration_form.html', context, request=request)
     
     def json_response(success, form=None, redirect_url=None, **kwargs):
         response_data = {
@@ -926,13 +1065,15 @@ def customer_register(request: HttpRequest):
         }
         
         if form is not None:
-            if form.is_valid():
-                response_data['form_html'] = render_form(step, form).content.decode('utf-8')
-            else:
+            if not form.is_valid():
                 response_data['errors'] = get_form_errors(form)
-                response_data['form_html'] = render_form(step, form).content.decode('utf-8')
+                response_data['form_html'] = render_form(step, form)
+            elif not redirect_url:
+                # The client follows redirect_url before reading form_html, so only
+                # render the partial when it will actually be displayed
+                response_data['form_html'] = render_form(step, form)
         
-        return JsonResponse(response_data)
+        return OrjsonResponse(response_data)
     
     # Handle GET request for loading a specific step via AJAX
     if request.method == 'GET' and is_ajax and load_step:
@@ -966,43 +1107,16 @@ def customer_register(request: HttpRequest):
                     inferred = 'inquiry'
                 order_initial['type'] = inferred
             # Prefill from step3
-            if order_initial['type'] == 'service':
-                sel_services = step3d.get('service_selection') or step3d.get('service_type') or []
-                if sel_services:
-                    order_initial['service_selection'] = sel_services
-                if step3d.get('description'):
-                    order_initial['description'] = step3d.get('description')
-                if step3d.get('estimated_duration'):
-                    order_initial['estimated_duration'] = step3d.get('estimated_duration')
-            elif order_initial['type'] == 'sales':
-                if step3d.get('item_id'):
-                    order_initial['item_name'] = step3d.get('item_id')
-                if step3d.get('quantity'):
-                    order_initial['quantity'] = step3d.get('quantity')
-                if step3d.get('tire_type'):
-                    order_initial['tire_type'] = step3d.get('tire_type')
-                if step3d.get('brand'):
-                    order_initial['brand'] = step3d.get('brand')
-                if step3d.get('description'):
-                    order_initial['description'] = step3d.get('description')
-            elif order_initial['type'] == 'inquiry':
-                if step3d.get('priority'):
-                    order_initial['priority'] = step3d.get('priority')
-                if step3d.get('inquiry_type'):
-                    order_initial['inquiry_type'] = step3d.get('inquiry_type')
-                if step3d.get('questions'):
-                    order_initial['questions'] = step3d.get('questions')
-                if step3d.get('contact_preference'):
-                    order_initial['contact_preference'] = step3d.get('contact_preference')
-                followup = step3d.get('followup_date') or step3d.get('follow_up_date')
-                if followup:
-                    order_initial['follow_up_date'] = followup
+            for field, sources in _ORDER_INITIAL_MAP.get(order_initial['type'], ()):
+                value = next((step3d[src] for src in sources if step3d.get(src)), None)
+                if value:
+                    order_initial[field] = value
             ctx['order_form'] = OrderForm(initial=order_initial)
             ctx['order_type'] = order_initial.get('type')
             ctx['vehicle_form'] = VehicleForm()
         form_html = render_to_string('tracker/partials/customer_registration_form.html', ctx, request=request)
 
-        return JsonResponse({
+        return OrjsonResponse({
             'success': True,
             'form_html': form_html,
             'step': step
@@ -1023,33 +1137,19 @@ def customer_register(request: HttpRequest):
                 messages.error(request, "Please complete Step 1 (customer info) before saving.")
                 return redirect(f"{reverse('tracker:customer_register')}?step=1")
             # Duplicate handling (same-branch exact identity)
-            from .utils import get_user_branch
-            user_branch = get_user_branch(request.user)
             existing = Customer.objects.filter(branch=user_branch, full_name__iexact=full_name, phone=phone).first()
             if existing:
                 if is_ajax:
-                    dup_url = reverse("tracker:customer_detail", kwargs={'pk': existing.id}) + "?flash=existing_customer"
+                    dup_url = _detail_url("tracker:customer_detail", existing.id) + "?flash=existing_customer"
                     return json_response(False, message=f"Customer '{full_name}' already exists.", message_type="info", redirect_url=dup_url)
                 messages.info(request, f"Customer '{full_name}' already exists. Redirected to their profile.")
                 return redirect("tracker:customer_detail", pk=existing.id)
             # Create new customer from step1 session
-            c = Customer.objects.create(
-                full_name=full_name,
-                phone=phone,
-                whatsapp=step1_data.get("whatsapp"),
-                email=step1_data.get("email"),
-                address=step1_data.get("address"),
-                notes=step1_data.get("notes"),
-                customer_type=step1_data.get("customer_type"),
-                organization_name=step1_data.get("organization_name"),
-                tax_number=step1_data.get("tax_number"),
-                personal_subtype=step1_data.get("personal_subtype"),
-                branch=user_branch,
-            )
+            c = _create_customer(step1_data, user_branch, full_name=full_name, phone=phone)
             # Clear session step1 after save
             request.session.pop('reg_step1', None)
             if is_ajax:
-                return json_response(True, message="Customer saved successfully", message_type="success", redirect_url=reverse("tracker:customer_detail", kwargs={'pk': c.id}))
+                return json_response(True, message="Customer saved successfully", message_type="success", redirect_url=_detail_url("tracker:customer_detail", c.id))
             messages.success(request, "Customer saved successfully")
             return redirect("tracker:customer_detail", pk=c.id)
         if step == 1:
@@ -1062,127 +1162,52 @@ def customer_register(request: HttpRequest):
                 full_name = data.get("full_name")
                 phone = data.get("phone")
                 
-                if action == "save_customer" or save_only:
-                    
-                    # Normalize phone number (remove all non-digit characters)
-                    import re
-                    normalized_phone = re.sub(r'\D', '', phone) if phone else ''
-                    
-                    # Check for existing customers with similar name and phone
-                    from .utils import get_user_branch
-                    existing_customers = Customer.objects.filter(
-                        full_name__iexact=full_name,
-                        branch=get_user_branch(request.user)
-                    )
-
-                    # Check each potential match for phone number similarity
-                    for customer in existing_customers:
-                        # Normalize stored phone number for comparison
-                        stored_phone = re.sub(r'\D', '', str(customer.phone or ''))
-                        # Check for exact or partial match (at least 6 digits matching)
-                        if len(normalized_phone) >= 6 and len(stored_phone) >= 6:
-                            if normalized_phone in stored_phone or stored_phone in normalized_phone:
-                                from .utils import get_user_branch
-                                user_branch = get_user_branch(request.user)
-                                can_access = getattr(request.user, 'is_superuser', False) or (user_branch is not None and getattr(customer, 'branch_id', None) == user_branch.id)
-                                if is_ajax:
-                                    if can_access:
-                                        dup_url = reverse("tracker:customer_detail", kwargs={'pk': customer.id}) + "?flash=existing_customer"
-                                        return json_response(
-                                            False,
-                                            form=form,
-                                            message=f'Customer already exists: {customer.full_name} ({customer.phone})',
-                                            message_type='warning',
-                                            redirect_url=dup_url
-                                        )
-                                    else:
-                                        # Cross-branch duplicate: allow creation in current branch (do not return), but set a message and break out to create
-                                        dup_cross_branch = True
-                                        messages.warning(request, f'Customer exists in another branch: {customer.full_name} ({customer.phone}). A separate customer will be created in your branch.')
-                                        break
-                                # Non-AJAX flow
-                                messages.warning(request, f'Customer already exists: {customer.full_name} ({customer.phone})')
-                                if can_access:
-                                    detail_url = reverse("tracker:customer_detail", kwargs={'pk': customer.id}) + "?flash=existing_customer"
-                                    return redirect(detail_url)
-                                else:
-                                    dup_cross_branch = True
-                                    messages.info(request, 'A customer with the same details exists in another branch. A separate record will be created for your branch.')
-                                    break
-                    
-                        # If quick save, create the customer immediately
-                        from .utils import get_user_branch
-                        c = Customer.objects.create(
-                            full_name=full_name,
-                            phone=phone,
-                            whatsapp=data.get("whatsapp"),
-                            email=data.get("email"),
-                            address=data.get("address"),
-                            notes=data.get("notes"),
-                            customer_type=data.get("customer_type"),
-                            organization_name=data.get("organization_name"),
-                            tax_number=data.get("tax_number"),
-                            personal_subtype=data.get("personal_subtype"),
-                            branch=get_user_branch(request.user)
-                        )
-
-                        # Clear session data after saving
-                        if 'reg_step1' in request.session:
-                            del request.session['reg_step1']
-
+                quick_save = action == "save_customer" or save_only
+
+                # Block duplicates and redirect to the existing profile
+                customer, cross_branch = _find_duplicate(full_name, phone, request.user, user_branch)
+                if customer is not None:
+                    if not cross_branch:
+                        dup_url = _detail_url("tracker:customer_detail", customer.id) + "?flash=existing_customer"
+                        if quick_save:
+                            message = f'Customer already exists: {customer.full_name} ({customer.phone})'
+                            message_type = 'warning'
+                        else:
+                            message = f"Customer '{customer.full_name}' already exists. Redirected to their profile."
+                            message_type = 'info'
                         if is_ajax:
                             return json_response(
-                                True,
-                                message="Customer saved successfully",
-                                message_type="success",
-                                redirect_url=reverse("tracker:customer_detail", kwargs={'pk': c.id})
+                                False,
+                                form=form,
+                                message=message,
+                                message_type=message_type,
+                                redirect_url=dup_url
                             )
+                        messages.add_message(request, messages.WARNING if quick_save else messages.INFO, message)
+                        return redirect(dup_url)
+                    # Cross-branch duplicate: allow creation in current branch, but set a message
+                    messages.info(request, f"A customer with similar details exists in another branch: {customer.full_name} ({customer.phone}). A separate customer will be created for your branch.")
 
-                        messages.success(request, "Customer saved successfully")
-                        return redirect("tracker:customer_detail", pk=c.id)
-                
-                # Even when not saving immediately, block duplicates and redirect to existing profile
-                try:
-                    import re
-                    normalized_phone = re.sub(r'\D', '', phone) if phone else ''
-                    from .utils import get_user_branch
-                    existing_customers = Customer.objects.filter(full_name__iexact=full_name, branch=get_user_branch(request.user))
-                    dup_cross_branch = False
-                    for customer in existing_customers:
-                        stored_phone = re.sub(r'\D', '', str(customer.phone or ''))
-                        if len(normalized_phone) >= 6 and len(stored_phone) >= 6:
-                            if normalized_phone in stored_phone or stored_phone in normalized_phone:
-                                from .utils import get_user_branch
-                                user_branch = get_user_branch(request.user)
-                                can_access = getattr(request.user, 'is_superuser', False) or (user_branch is not None and getattr(customer, 'branch_id', None) == user_branch.id)
-                                if is_ajax:
-                                    if can_access:
-                                        dup_url = reverse("tracker:customer_detail", kwargs={'pk': customer.id}) + "?flash=existing_customer"
-                                        return json_response(
-                                            False,
-                                            form=form,
-                                            message=f"Customer '{customer.full_name}' already exists. Redirected to their profile.",
-                                            message_type='info',
-                                            redirect_url=dup_url
-                                        )
-                                    else:
-                                        dup_cross_branch = True
-                                        messages.info(request, f"A customer with similar details exists in another branch: {customer.full_name} ({customer.phone}). A separate customer will be created for your branch.")
-                                        break
-                                messages.info(request, f"Customer '{customer.full_name}' already exists. Redirected to their profile.")
-                                if can_access:
-                                    detail_url = reverse("tracker:customer_detail", kwargs={'pk': customer.id}) + "?flash=existing_customer"
-                                    return redirect(detail_url)
-                                else:
-                                    dup_cross_branch = True
-                                    messages.info(request, 'A customer with similar details exists in another branch. A separate record will be created for your branch.')
-                                    break
-                except Exception:
-                    pass
+                if quick_save:
+                    # If quick save, create the customer immediately
+                    c = _create_customer(data, user_branch)
+
+                    # Clear session data after saving
+                    request.session.pop('reg_step1', None)
+
+                    if is_ajax:
+                        return json_response(
+                            True,
+                            message="Customer saved successfully",
+                            message_type="success",
+                            redirect_url=_detail_url("tracker:customer_detail", c.id)
+                        )
+
+                    messages.success(request, "Customer saved successfully")
+                    return redirect("tracker:customer_detail", pk=c.id)
 
                 # Continue to next step
                 request.session["reg_step1"] = form.cleaned_data
-                request.session.save()
                 
                 if is_ajax:
                     return json_response(True)
@@ -1196,7 +1221,6 @@ def customer_register(request: HttpRequest):
             form = CustomerStep2Form(request.POST)
             if form.is_valid():
                 request.session["reg_step2"] = form.cleaned_data
-                request.session.save()
                 intent = form.cleaned_data.get("intent")
                 # If inquiry, skip service type selection and go to step 4
                 next_step = 4 if intent == "inquiry" else 3
@@ -1222,7 +1246,6 @@ def customer_register(request: HttpRequest):
                     'questions': request.POST.get('questions') or '',
                 }
                 request.session['reg_step3'] = step3_data
-                request.session.save()
                 if is_ajax:
                     return json_response(True, next_step=4)
                 return redirect(f"{reverse('tracker:customer_register')}?step=4")
@@ -1234,15 +1257,9 @@ def customer_register(request: HttpRequest):
                 if _intent == 'sales':
                     item_id = (request.POST.get('item_name') or '').strip()
                     # Get item details if item_id is provided
-                    item_name = ''
-                    brand_name = ''
-                    if item_id:
-                        try:
-                            item = InventoryItem.objects.select_related('brand').get(id=item_id)
-                            item_name = item.name
-                            brand_name = item.brand.name if item.brand else ''
-                        except InventoryItem.DoesNotExist:
-                            pass
+                    row = InventoryItem.objects.filter(id=item_id).values('name', 'brand__name').first() if item_id else None
+                    item_name = row['name'] if row else ''
+                    brand_name = (row['brand__name'] or '') if row else ''
                     
                     step3_data.update({
                         'item_id': item_id,
@@ -1265,7 +1282,6 @@ def customer_register(request: HttpRequest):
                         'estimated_duration': request.POST.get('estimated_duration', '').strip(),
                     })
                 request.session["reg_step3"] = step3_data
-                request.session.save()
                 
                 if is_ajax:
                     return json_response(True, next_step=4)
@@ -1280,7 +1296,7 @@ def customer_register(request: HttpRequest):
                 # Get all session data
                 step1_data = request.session.get("reg_step1", {})
                 step2_data = request.session.get("reg_step2", {})
-                step3_data = request.session.get("reg_step3", {})
+                step3_data = request.session.get("reg_step3") or {}
                 
                 # Validate that we have required data
                 if not step1_data.get("full_name"):
@@ -1301,23 +1317,28 @@ def customer_register(request: HttpRequest):
                 phone = data.get("phone")
                 
                 # Match DB uniqueness: check same-branch exact duplicate first (branch, full_name, phone, organization_name, tax_number)
-                from .utils import get_user_branch
-                user_branch = get_user_branch(request.user)
                 org_name = data.get("organization_name") or None
                 tax_num = data.get("tax_number") or None
 
-                existing_same_branch = Customer.objects.filter(
-                    branch=user_branch,
-                    full_name__iexact=full_name,
-                    phone=phone,
-                    organization_name=org_name,
-                    tax_number=tax_num,
-                ).first()
+                # One query for both the same-branch and other-branch candidates
+                identity_matches = list(
+                    Customer.objects.filter(
+                        full_name__iexact=full_name,
+                        phone=phone,
+                        organization_name=org_name,
+                        tax_number=tax_num,
+                    )
+                    .select_related('branch')
+                    .only('id', 'branch_id', 'branch__name')
+                    .annotate(same_branch=Case(When(branch=user_branch, then=Value(1)), default=Value(0), output_field=IntegerField()))
+                    .order_by('-same_branch')[:2]
+                )
+                existing_same_branch = next((m for m in identity_matches if m.same_branch), None)
 
                 if existing_same_branch:
                     can_access = getattr(request.user, 'is_superuser', False) or (user_branch is not None and getattr(existing_same_branch, 'branch_id', None) == user_branch.id)
                     if is_ajax and can_access:
-                        dup_url = reverse("tracker:customer_detail", kwargs={'pk': existing_same_branch.id}) + "?flash=existing_customer"
+                        dup_url = _detail_url("tracker:customer_detail", existing_same_branch.id) + "?flash=existing_customer"
                         return json_response(
                             False,
                             form=form,
@@ -1326,211 +1347,171 @@ def customer_register(request: HttpRequest):
                             redirect_url=dup_url
                         )
                     messages.info(request, f"Customer '{full_name}' with phone '{phone}' already exists in your branch. Redirected to their profile.")
-                    detail_url = reverse("tracker:customer_detail", kwargs={'pk': existing_same_branch.id}) + "?flash=existing_customer"
+                    detail_url = _detail_url("tracker:customer_detail", existing_same_branch.id) + "?flash=existing_customer"
                     return redirect(detail_url)
 
                 # If exists in another branch with same identity, allow creation but warn
-                existing_other = Customer.objects.filter(
-                    full_name__iexact=full_name,
-                    phone=phone,
-                    organization_name=org_name,
-                    tax_number=tax_num,
-                ).exclude(branch=user_branch).first()
+                existing_other = next((m for m in identity_matches if not m.same_branch), None)
                 if existing_other:
                     other_branch = getattr(existing_other, 'branch', None)
                     branch_name = getattr(other_branch, 'name', other_branch) if other_branch else 'another branch'
                     messages.warning(request, f"A customer with the same identity exists in {branch_name}. A separate customer will be created for your branch.")
 
-                # Create new customer
-                c = Customer.objects.create(
-                    full_name=full_name,
-                    phone=phone,
-                    whatsapp=data.get("whatsapp"),
-                    email=data.get("email"),
-                    address=data.get("address"),
-                    notes=data.get("notes") or data.get("additional_notes"),
-                    customer_type=data.get("customer_type"),
-                    organization_name=org_name,
-                    tax_number=tax_num,
-                    personal_subtype=data.get("personal_subtype"),
-                    branch=user_branch,
-                )
+                # Customer, vehicle, order and stock changes commit together
+                try:
+                    with transaction.atomic():
+                        # Create new customer
+                        c = _create_customer(
+                            data,
+                            user_branch,
+                            notes=data.get("notes") or data.get("additional_notes"),
+                            organization_name=org_name,
+                            tax_number=tax_num,
+                        )
                 
-                # Create vehicle if vehicle information is provided
-                v = None
-                intent = step2_data.get("intent")
-                service_type = step3_data.get("service_type")
+                        # Create vehicle if vehicle information is provided
+                        v = None
+                        intent = step2_data.get("intent")
+                        service_type = step3_data.get("service_type")
                 
-                # Get vehicle information from form
-                plate_number = request.POST.get("plate_number", "").strip()
-                make = request.POST.get("make", "").strip()
-                model = request.POST.get("model", "").strip()
-                vehicle_type = request.POST.get("vehicle_type", "").strip()
+                        # Get vehicle information from form
+                        plate_number = request.POST.get("plate_number", "").strip()
+                        make = request.POST.get("make", "").strip()
+                        model = request.POST.get("model", "").strip()
+                        vehicle_type = request.POST.get("vehicle_type", "").strip()
                 
-                # Create vehicle if any vehicle information is provided
-                if plate_number or make or model or vehicle_type:
-                    v = Vehicle.objects.create(
-                        customer=c,
-                        plate_number=plate_number or None,
-                        make=make or None,
-                        model=model or None,
-                        vehicle_type=vehicle_type or None
-                    )
+                        # Create vehicle if any vehicle information is provided
+                        if plate_number or make or model or vehicle_type:
+                            v = _order_vehicle(c, plate_number, make, model, vehicle_type)
                 
-                # Create order based on intent and service type
-                o = None
-                description = request.POST.get("description", "").strip()
+                        # Create order based on intent and service type
+                        o = None
+                        description = request.POST.get("description", "").strip()
                 
-                if intent == "sales":
-                    # Get data from step 3 session
-                    step3_data = request.session.get('reg_step3', {})
-                    item_id = step3_data.get('item_id') or request.POST.get("item_name")
-                    quantity = step3_data.get('quantity') or request.POST.get("quantity")
-                    tire_type = step3_data.get('tire_type') or request.POST.get("tire_type")
-                    tire_services = step3_data.get('tire_services', []) or request.POST.getlist("tire_services")
-
-                    if item_id and quantity:
-                        try:
-                            item = InventoryItem.objects.select_related('brand').get(id=item_id)
-                            qty_int = int(quantity)
+                        if intent == "sales":
+                            item_id = step3_data.get('item_id') or request.POST.get("item_name")
+                            quantity = step3_data.get('quantity') or request.POST.get("quantity")
+                            tire_type = step3_data.get('tire_type') or request.POST.get("tire_type")
+                            tire_services = step3_data.get('tire_services', []) or request.POST.getlist("tire_services")
+
+                            if item_id and quantity:
+                                try:
+                                    item = InventoryItem.objects.select_for_update().select_related('brand').get(id=item_id)
+                                    qty_int = int(quantity)
                             
-                            # Check inventory
-                            if item.quantity < qty_int:
-                                if is_ajax:
-                                    return json_response(
-                                        False,
-                                        form=form,
-                                        message=f'Only {item.quantity} in stock for {item.name} ({item.brand.name})',
-                                        message_type='error'
+                                    # Check inventory
+                                    if item.quantity < qty_int:
+                                        raise _SaleRejected(f'Only {item.quantity} in stock for {item.name} ({item.brand.name})')
+
+                                    desc_addons = (", addons: " + ", ".join(tire_services)) if tire_services else ""
+                                    final_description = description or f"Tire Sales: {item.name} ({item.brand.name}) - {tire_type}{desc_addons}"
+
+                                    # Compute estimated duration from selected add-ons
+                                    est_minutes = 0
+                                    try:
+                                        if tire_services:
+                                            est_minutes = catalog_minutes(get_service_addons(), tire_services)
+                                    except (TypeError, ValueError, DatabaseError) as e:
+                                        logger.warning("Add-on duration lookup failed: %s", e)
+                                        est_minutes = 0
+
+                                    o = Order.objects.create(
+                                        customer=c,
+                                        vehicle=v,
+                                        branch=user_branch,
+                                        type="sales",
+                                        item_name=item.name,
+                                        brand=item.brand.name,
+                                        quantity=qty_int,
+                                        tire_type=tire_type,
+                                        status="created",
+                                        description=final_description,
+                                        estimated_duration=est_minutes or None
                                     )
-                                messages.error(request, f'Only {item.quantity} in stock for {item.name} ({item.brand.name})')
-                                return render(request, "tracker/customer_register.html", get_template_context(4, form))
-
-                            desc_addons = (", addons: " + ", ".join(tire_services)) if tire_services else ""
-                            final_description = description or f"Tire Sales: {item.name} ({item.brand.name}) - {tire_type}{desc_addons}"
 
-                            # Compute estimated duration from selected add-ons
-                            est_minutes = 0
+                                    # Decrement the locked row by pk; stock was checked above
+                                    InventoryItem.objects.filter(pk=item.pk).update(quantity=F('quantity') - qty_int)
+                                    transaction.on_commit(lambda: clear_inventory_cache(item.name, item.brand.name))
+                            
+                                except InventoryItem.DoesNotExist:
+                                    raise _SaleRejected('Selected item not found in inventory', ajax_message='Selected item not found')
+                                except ValueError:
+                                    raise _SaleRejected('Invalid quantity')
+                            else:
+                                raise _SaleRejected('Item and quantity are required for sales orders', ajax_message='Item and quantity are required')
+                        
+                        # ... (rest of the code remains the same)
+                        elif intent == "service":
+                            selected_svcs = step3_data.get('service_selection', []) or request.POST.getlist('service_selection')
+                            desc_svcs = (", services: " + ", ".join(selected_svcs)) if selected_svcs else ""
+                            final_description = description or f"Car Service{desc_svcs}"
+                            estimated_duration = step3_data.get('estimated_duration') or request.POST.get("estimated_duration")
+                            # Derive from selected service types when not provided
                             try:
-                                if tire_services:
-                                    from .models import ServiceAddon
-                                    addons = ServiceAddon.objects.filter(name__in=tire_services, is_active=True)
-                                    est_minutes = int(sum(int(a.estimated_minutes or 0) for a in addons))
-                            except Exception:
-                                est_minutes = 0
-
-                            from .utils import get_user_branch
+                                est_int = int(estimated_duration) if estimated_duration else None
+                            except (ValueError, TypeError):
+                                est_int = None
+                            if est_int is None and selected_svcs:
+                                try:
+                                    est_int = catalog_minutes(get_service_types(), selected_svcs) or None
+                                except (TypeError, ValueError, DatabaseError) as e:
+                                    logger.warning("Service duration lookup failed: %s", e)
+                                    est_int = None
+
                             o = Order.objects.create(
                                 customer=c,
                                 vehicle=v,
-                                branch=get_user_branch(request.user),
-                                type="sales",
-                                item_name=item.name,
-                                brand=item.brand.name,
-                                quantity=qty_int,
-                                tire_type=tire_type,
+                                branch=user_branch,
+                                type="service",
                                 status="created",
                                 description=final_description,
-                                estimated_duration=est_minutes or None
+                                estimated_duration=est_int
                             )
 
-                            # Update customer visit/arrival status
-                            c.arrival_time = timezone.now()
-                            c.current_status = 'arrived'
-                            c.save(update_fields=['arrival_time','current_status'])
-
-                            # Adjust inventory
-                            from .utils import adjust_inventory
-                            adjust_inventory(item.name, item.brand.name, -qty_int)
-                            
-                        except InventoryItem.DoesNotExist:
-                            if is_ajax:
-                                return json_response(False, form=form, message='Selected item not found')
-                            messages.error(request, 'Selected item not found in inventory')
-                            return render(request, "tracker/customer_register.html", get_template_context(4, form))
-                        except ValueError:
-                            if is_ajax:
-                                return json_response(False, form=form, message='Invalid quantity')
-                            messages.error(request, 'Invalid quantity')
-                            return render(request, "tracker/customer_register.html", get_template_context(4, form))
-                    else:
-                        if is_ajax:
-                            return json_response(False, form=form, message='Item and quantity are required')
-                        messages.error(request, 'Item and quantity are required for sales orders')
-                        return render(request, "tracker/customer_register.html", get_template_context(4, form))
-                        
-                # ... (rest of the code remains the same)
-                elif intent == "service":
-                    # Get data from step 3 session
-                    step3_data = request.session.get('reg_step3', {})
-                    selected_svcs = step3_data.get('service_selection', []) or request.POST.getlist('service_selection')
-                    desc_svcs = (", services: " + ", ".join(selected_svcs)) if selected_svcs else ""
-                    final_description = description or f"Car Service{desc_svcs}"
-                    estimated_duration = step3_data.get('estimated_duration') or request.POST.get("estimated_duration")
-                    # Derive from selected service types when not provided
-                    try:
-                        est_int = int(estimated_duration) if estimated_duration else None
-                    except (ValueError, TypeError):
-                        est_int = None
-                    if est_int is None and selected_svcs:
-                        try:
-                            from .models import ServiceType
-                            svc_qs = ServiceType.objects.filter(name__in=selected_svcs, is_active=True)
-                            est_int = int(sum(int(s.estimated_minutes or 0) for s in svc_qs)) or None
-                        except Exception:
-                            est_int = None
-
-                    from .utils import get_user_branch
-                    o = Order.objects.create(
-                        customer=c,
-                        vehicle=v,
-                        branch=get_user_branch(request.user),
-                        type="service",
-                        status="created",
-                        description=final_description,
-                        estimated_duration=est_int
-                    )
-
 
                     
-                elif intent == "inquiry":
-                    # Get data from step 3 session
-                    step3_data = request.session.get('reg_step3', {})
-                    inquiry_type = step3_data.get('inquiry_type') or request.POST.get("inquiry_type")
-                    questions = step3_data.get('questions') or request.POST.get("questions")
-                    contact_preference = step3_data.get('contact_preference') or request.POST.get("contact_preference")
-                    followup_date = step3_data.get('followup_date') or request.POST.get("followup_date")
+                        elif intent == "inquiry":
+                            inquiry_type = step3_data.get('inquiry_type') or request.POST.get("inquiry_type")
+                            questions = step3_data.get('questions') or request.POST.get("questions")
+                            contact_preference = step3_data.get('contact_preference') or request.POST.get("contact_preference")
+                            followup_date = step3_data.get('followup_date') or request.POST.get("followup_date")
                     
-                    final_description = description or f"Inquiry: {inquiry_type} - {questions}"
+                            final_description = description or f"Inquiry: {inquiry_type} - {questions}"
                     
-                    from .utils import get_user_branch
-                    o = Order.objects.create(
-                        customer=c,
-                        vehicle=v,
-                        branch=get_user_branch(request.user),
-                        type="inquiry",
-                        status="created",
-                        description=final_description,
-                        inquiry_type=inquiry_type,
-                        questions=questions,
-                        contact_preference=contact_preference,
-                        follow_up_date=followup_date if followup_date else None
-                    )
+                            o = Order.objects.create(
+                                customer=c,
+                                vehicle=v,
+                                branch=user_branch,
+                                type="inquiry",
+                                status="created",
+                                description=final_description,
+                                inquiry_type=inquiry_type,
+                                questions=questions,
+                                contact_preference=contact_preference,
+                                follow_up_date=followup_date if followup_date else None
+                            )
 
 
-                # Update customer visit/arrival status for returning tracking
-                try:
-                    now_ts = timezone.now()
-                    c.arrival_time = now_ts
-                    c.current_status = 'arrived'
-                    c.last_visit = now_ts
-                    c.total_visits = (c.total_visits or 0) + 1
-                    c.save(update_fields=['arrival_time','current_status','last_visit','total_visits'])
-                except Exception:
-                    pass
+                        # Update customer visit/arrival status for returning tracking.
+                        # Savepoint so a failure here doesn't roll back the registration.
+                        try:
+                            now_ts = timezone.now()
+                            c.arrival_time = now_ts
+                            c.current_status = 'arrived'
+                            c.last_visit = now_ts
+                            c.total_visits = (c.total_visits or 0) + 1
+                            with transaction.atomic():
+                                c.save(update_fields=['arrival_time','current_status','last_visit','total_visits'])
+                        except DatabaseError as e:
+                            logger.warning("Customer visit update failed for customer %s: %s", c.pk, e)
+                except _SaleRejected as exc:
+                    if is_ajax:
+                        return json_response(False, form=form, message=exc.ajax_message, message_type='error')
+                    messages.error(request, str(exc))
+                    return render(request, "tracker/customer_register.html", get_template_context(4, form))
                 
                 # Clear session data
-                for key in ["reg_step1", "reg_step2", "reg_step3"]:
+                for key in _REGISTRATION_SESSION_KEYS:
                     request.session.pop(key, None)
                 
                 if is_ajax:
@@ -1539,14 +1520,14 @@ def customer_register(request: HttpRequest):
                             True,
                             message="Customer registered and order created successfully",
                             message_type="success",
-                            redirect_url=reverse("tracker:order_detail", kwargs={'pk': o.id})
+                            redirect_url=_detail_url("tracker:order_detail", o.id)
                         )
                     else:
                         return json_response(
                             True,
                             message="Customer registered successfully",
                             message_type="success",
-                            redirect_url=reverse("tracker:customer_detail", kwargs={'pk': c.id})
+                            redirect_url=_detail_url("tracker:customer_detail", c.id)
                         )
                     
                 if o:
@@ -1588,37 +1569,11 @@ def customer_register(request: HttpRequest):
     context["step3"] = request.session.get("reg_step3", {})
     context["today"] = timezone.now().date()
     # Get brands and inventory items for all steps
-    context["brands"] = Brand.objects.filter(is_active=True)
-    inventory_items = InventoryItem.objects.select_related('brand').filter(is_active=True, brand__isnull=False).order_by('brand__name', 'name')
-    context["inventory_items"] = inventory_items
-
-    # Build item data mapping for JavaScript
-    item_data = {}
-    for item in inventory_items:
-        if item.name and item.brand:
-            item_data[str(item.id)] = {
-                'name': item.name,
-                'brand': item.brand.name,
-                'quantity': item.quantity
-            }
-    context["item_data_json"] = json.dumps(item_data)
+    context["brands"] = get_active_brands()
+    context["inventory_items"], context["item_data_json"] = get_registration_items()
 
     # Dynamic service types and sales add-ons
-    try:
-        from .models import ServiceType, ServiceAddon
-        svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-        addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-        context["service_types"] = [{
-            'name': s.name,
-            'estimated_minutes': int(s.estimated_minutes or 0)
-        } for s in svc_qs]
-        context["sales_addons"] = [{
-            'name': a.name,
-            'estimated_minutes': int(a.estimated_minutes or 0)
-        } for a in addon_qs]
-    except Exception:
-        context["service_types"] = []
-        context["sales_addons"] = []
+    context.update(_service_catalog_context())
 
     context["service_offers"] = [
         'Oil Change', 'Engine Diagnostics', 'Brake Repair', 'Tire Rotation',
@@ -1699,9 +1654,11 @@ def create_service_type(request: HttpRequest):
         active = bool(data.get('is_active', True))
         if not name:
             return JsonResponse({'success': False, 'error': 'Name is required'}, status=400)
-        if ServiceType.objects.filter(name__iexact=name).exists():
+        try:
+            with transaction.atomic():
+                t = ServiceType.objects.create(name=name, estimated_minutes=est, is_active=active)
+        except IntegrityError:
             return JsonResponse({'success': False, 'error': 'Service type already exists'}, status=400)
-        t = ServiceType.objects.create(name=name, estimated_minutes=est, is_active=active)
         return JsonResponse({'success': True, 'id': t.id})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1719,12 +1676,14 @@ def update_service_type(request: HttpRequest, pk: int):
         active = bool(data.get('is_active', True))
         if not name:
             return JsonResponse({'success': False, 'error': 'Name is required'}, status=400)
-        if ServiceType.objects.filter(name__iexact=name).exclude(pk=pk).exists():
-            return JsonResponse({'success': False, 'error': 'Another type with this name exists'}, status=400)
         t.name = name
         t.estimated_minutes = est
         t.is_active = active
-        t.save()
+        try:
+            with transaction.atomic():
+                t.save()
+        except IntegrityError:
+            return JsonResponse({'success': False, 'error': 'Another type with this name exists'}, status=400)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1741,9 +1700,11 @@ def create_service_addon(request: HttpRequest):
         active = bool(data.get('is_active', True))
         if not name:
             return JsonResponse({'success': False, 'error': 'Name is required'}, status=400)
-        if ServiceAddon.objects.filter(name__iexact=name).exists():
+        try:
+            with transaction.atomic():
+                a = ServiceAddon.objects.create(name=name, estimated_minutes=est, is_active=active)
+        except IntegrityError:
             return JsonResponse({'success': False, 'error': 'Service add-on already exists'}, status=400)
-        a = ServiceAddon.objects.create(name=name, estimated_minutes=est, is_active=active)
         return JsonResponse({'success': True, 'id': a.id})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1761,12 +1722,14 @@ def update_service_addon(request: HttpRequest, pk: int):
         active = bool(data.get('is_active', True))
         if not name:
             return JsonResponse({'success': False, 'error': 'Name is required'}, status=400)
-        if ServiceAddon.objects.filter(name__iexact=name).exclude(pk=pk).exists():
-            return JsonResponse({'success': False, 'error': 'Another add-on with this name exists'}, status=400)
         a.name = name
         a.estimated_minutes = est
         a.is_active = active
-        a.save()
+        try:
+            with transaction.atomic():
+                a.save()
+        except IntegrityError:
+            return JsonResponse({'success': False, 'error': 'Another add-on with this name exists'}, status=400)
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1785,38 +1748,18 @@ def start_order(request: HttpRequest):
 @login_required
 def create_order_for_customer(request: HttpRequest, pk: int):
     """Create a new order for a specific customer"""
-    from .utils import adjust_inventory
     customers_qs = scope_queryset(Customer.objects.all(), request.user, request)
     c = get_object_or_404(customers_qs, pk=pk)
     if request.method == "POST":
         form = OrderForm(request.POST)
         # Ensure vehicle belongs to this customer
-        form.fields["vehicle"].queryset = c.vehicles.all()
+        form.fields["vehicle"].queryset = c.vehicles.only('id', 'plate_number', 'make', 'model')
         if form.is_valid():
-            from .utils import get_user_branch
             o = form.save(commit=False)
             o.customer = c
             o.branch = get_user_branch(request.user)
             o.status = "created"
             
-            # Handle vehicle creation if new vehicle info is provided
-            if not o.vehicle:
-                plate_number = request.POST.get("plate_number", "").strip()
-                make = request.POST.get("make", "").strip()
-                model = request.POST.get("model", "").strip()
-                vehicle_type = request.POST.get("vehicle_type", "").strip()
-                
-                # Create vehicle if any vehicle information is provided
-                if plate_number or make or model or vehicle_type:
-                    v = Vehicle.objects.create(
-                        customer=c,
-                        plate_number=plate_number or None,
-                        make=make or None,
-                        model=model or None,
-                        vehicle_type=vehicle_type or None
-                    )
-                    o.vehicle = v
-            
             # Handle service selections for service orders
             if o.type == 'service':
                 service_selection = request.POST.getlist('service_selection')
@@ -1833,9 +1776,7 @@ def create_order_for_customer(request: HttpRequest, pk: int):
                     # Update estimated duration based on selected services if not already set
                     if not o.estimated_duration or o.estimated_duration == 50:
                         try:
-                            from .models import ServiceType
-                            service_types = ServiceType.objects.filter(name__in=service_selection, is_active=True)
-                            total_minutes = sum(int(s.estimated_minutes or 0) for s in service_types)
+                            total_minutes = catalog_minutes(get_service_types(), service_selection)
                             o.estimated_duration = total_minutes or 50
                         except Exception:
                             pass
@@ -1855,9 +1796,7 @@ def create_order_for_customer(request: HttpRequest, pk: int):
                     
                     # Update estimated duration based on selected tire services
                     try:
-                        from .models import ServiceAddon
-                        addons = ServiceAddon.objects.filter(name__in=tire_services, is_active=True)
-                        total_minutes = sum(int(a.estimated_minutes or 0) for a in addons)
+                        total_minutes = catalog_minutes(get_service_addons(), tire_services)
                         # Add to existing estimated duration if it exists
                         current_duration = o.estimated_duration or 0
                         o.estimated_duration = current_duration + total_minutes
@@ -1877,98 +1816,137 @@ def create_order_for_customer(request: HttpRequest, pk: int):
                 if available < qty:
                     messages.error(request, f'Only {available} in stock for {name} ({brand})')
                     return render(request, "tracker/order_create.html", {"customer": c, "form": form})
-            o.save()
-            # Update customer visit/arrival status for returning tracking
-            try:
-                now_ts = timezone.now()
-                c.arrival_time = now_ts
-                c.current_status = 'arrived'
-                c.last_visit = now_ts
-                c.total_visits = (c.total_visits or 0) + 1
-                c.save(update_fields=['arrival_time','current_status','last_visit','total_visits'])
-            except Exception:
-                pass
-            # Deduct inventory after save
-            if o.type == 'sales':
-                qty_int = int(o.quantity or 0)
-                ok, _, remaining = adjust_inventory(o.item_name, o.brand, -qty_int)
-                if ok:
-                    messages.success(request, f"Order created. Remaining stock for {o.item_name} ({o.brand}): {remaining}")
+            # Vehicle, order, visit stats and stock deduction commit together
+            with transaction.atomic():
+                # Handle vehicle creation if new vehicle info is provided (only once validation passed)
+                if not o.vehicle:
+                    plate_number = request.POST.get("plate_number", "").strip()
+                    make = request.POST.get("make", "").strip()
+                    model = request.POST.get("model", "").strip()
+                    vehicle_type = request.POST.get("vehicle_type", "").strip()
+                
+                    # Create vehicle if any vehicle information is provided
+                    if plate_number or make or model or vehicle_type:
+                        v = _order_vehicle(c, plate_number, make, model, vehicle_type)
+                        o.vehicle = v
+                o.save()
+                # Update customer visit/arrival status for returning tracking; the visit
+                # counter is incremented in SQL so concurrent orders don't race
+                try:
+                    now_ts = timezone.now()
+                    with transaction.atomic():
+                        Customer.objects.filter(pk=c.pk).update(
+                            arrival_time=now_ts,
+                            current_status='arrived',
+                            last_visit=now_ts,
+                            total_visits=F('total_visits') + 1,
+                        )
+                except DatabaseError:
+                    logger.warning("Failed to update visit status for customer %s", c.pk, exc_info=True)
+                # Deduct inventory after save
+                if o.type == 'sales':
+                    qty_int = int(o.quantity or 0)
+                    ok, _, remaining = adjust_inventory_by_id(form.inventory_item_id, -qty_int)
+                    if ok:
+                        messages.success(request, f"Order created. Remaining stock for {o.item_name} ({o.brand}): {remaining}")
+                    else:
+                        messages.warning(request, 'Order created, but inventory not adjusted')
                 else:
-                    messages.warning(request, 'Order created, but inventory not adjusted')
-            else:
-                messages.success(request, "Order created successfully")
+                    messages.success(request, "Order created successfully")
             return redirect("tracker:order_detail", pk=o.id)
         else:
             messages.error(request, "Please fix form errors and try again")
     else:
         form = OrderForm()
-        form.fields["vehicle"].queryset = c.vehicles.all()
+        form.fields["vehicle"].queryset = c.vehicles.only('id', 'plate_number', 'make', 'model')
     # Dynamic service types and add-ons for order form
-    try:
-        from .models import ServiceType, ServiceAddon
-        svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-        addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-        service_types = [{
-            'name': s.name,
-            'estimated_minutes': int(s.estimated_minutes or 0)
-        } for s in svc_qs]
-        sales_addons = [{
-            'name': a.name,
-            'estimated_minutes': int(a.estimated_minutes or 0)
-        } for a in addon_qs]
-    except Exception:
-        service_types = []
-        sales_addons = []
-    return render(request, "tracker/order_create.html", {"customer": c, "form": form, "service_types": service_types, "sales_addons": sales_addons})
+    return render(request, "tracker/order_create.html", {"customer": c, "form": form, **_service_catalog_context()})
 
 
-@login_required
-def customer_groups(request: HttpRequest):
-    """Advanced customer groups page with detailed analytics and insights"""
-    from django.db.models import Count, Sum, Avg, Max, Min, Q, F
-    from django.db.models.functions import TruncMonth, TruncWeek
+def _customer_order_count(**filters):
+    """Per-customer order count as a correlated subquery, free of join fan-out."""
+    rows = (Order.objects.filter(customer=OuterRef('pk'), **filters)
+            .order_by().values('customer').annotate(n=Count('id')).values('n'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def _customer_order_date(aggregate):
+    """Per-customer Max/Min order created_at as a correlated subquery."""
+    rows = (Order.objects.filter(customer=OuterRef('pk'))
+            .order_by().values('customer').annotate(d=aggregate('created_at')).values('d'))
+    return Subquery(rows)
+
+
+def _customer_vehicle_count():
+    """Per-customer vehicle count as a correlated subquery; no DISTINCT needed."""
+    rows = (Vehicle.objects.filter(customer=OuterRef('pk'))
+            .order_by().values('customer').annotate(n=Count('id')).values('n'))
+    return Coalesce(Subquery(rows), 0)
+
+
+_CUSTOMER_GROUP_STAT_KEYS = (
+    'total_revenue', 'avg_revenue_per_customer', 'total_orders', 'avg_orders_per_customer',
+    'avg_order_value', 'total_service_orders', 'total_sales_orders', 'total_inquiry_orders',
+    'total_completed_orders', 'total_cancelled_orders', 'total_vehicles',
+)
+
+
+def _empty_customer_groups(selected_group, start_date, today):
+    """Zero-filled _compute_customer_groups payload for a scope without customers."""
+    customer_groups = {
+        customer_type: {
+            'name': display_name,
+            'code': customer_type,
+            'total_customers': 0,
+            'growth_percent': 0,
+            'stats': dict.fromkeys(_CUSTOMER_GROUP_STAT_KEYS, 0),
+            'segmentation': {'high_value': 0, 'medium_value': 0, 'low_value': 0},
+            'activity_levels': {'very_active': 0, 'active': 0, 'inactive': 0},
+            'service_preferences': {'service_preference': 0, 'sales_preference': 0, 'mixed_preference': 0},
+            'trends': {'recent_new_customers': 0, 'returning_customers': 0, 'completion_rate': 0},
+            'top_customers': [],
+        }
+        for customer_type, display_name in Customer.TYPE_CHOICES
+    }
+    return {
+        'customer_groups': customer_groups,
+        'overall_stats': {
+            'total_revenue': 0, 'total_orders': 0, 'revenue_growth': 0, 'orders_growth': 0,
+            'avg_revenue_per_customer': 0, 'avg_orders_per_customer': 0,
+        },
+        'selected_group_display': _CUSTOMER_TYPE_DICT.get(selected_group, '') if selected_group != 'all' else '',
+        'detailed_customers': [],
+        'monthly_trends': {
+            customer_type: {'name': display_name, 'data': []}
+            for customer_type, display_name in Customer.TYPE_CHOICES
+        },
+        'monthly_charts': {},
+        'monthly_chart_data': {},
+        'chart_image': None,
+        'start_date': start_date,
+        'end_date': today,
+        'total_customers': 0,
+        'active_customers_this_month': 0,
+        'total_revenue': 0,
+        'total_orders': 0,
+        'revenue_growth': 0,
+        'orders_growth': 0,
+        'customers_growth': 0,
+    }
+
+
+def _compute_customer_groups(request, selected_group, time_period, sort_by):
+    """Build the customer_groups analytics payload; the result is cached by the view."""
+    from django.db.models import Count, Sum, Avg, Max, Min, Q, F, Window
+    from django.db.models.functions import RowNumber
     from datetime import datetime, timedelta
-    
-    # Handle AJAX requests
-    # If this is an AJAX request to load a group's detail partial, we must NOT early-return here.
-    # Only delegate to the JSON data endpoint when it's an AJAX request without load_group=1.
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' and request.GET.get('load_group') != '1':
-        return customer_groups_data(request)
-        
+
     # Optional server-side chart generation (matplotlib may be unavailable in some envs)
     try:
         from tracker.utils.chart_utils import generate_monthly_trend_chart
     except Exception:
         generate_monthly_trend_chart = None
     
-    # Get filter parameters
-    selected_group = request.GET.get('group', 'all')
-    time_period = request.GET.get('period', '6months')
-    sort_by = request.GET.get('sort')
-    
-    # Set default sort if not provided or empty
-    if not sort_by:
-        sort_by = 'total_spent'
-    
-    # Validate sort field
-    valid_sort_fields = [
-        'total_spent', 'recent_orders_count', 'last_order_date', 'first_order_date',
-        'service_orders', 'sales_orders', 'inquiry_orders', 'completed_orders',
-        'cancelled_orders', 'vehicles_count'
-    ]
-    
-    # Extract field name and direction
-    sort_field = sort_by.lstrip('-')
-    sort_direction = '-' if sort_by.startswith('-') else ''
-    
-    # Validate sort field
-    if sort_field not in valid_sort_fields:
-        sort_field = 'total_spent'
-        sort_direction = '-'
-    
-    sort_by = f"{sort_direction}{sort_field}"
-    
     # Calculate time range
     today = timezone.now().date()
     if time_period == '1month':
@@ -1982,52 +1960,108 @@ def customer_groups(request: HttpRequest):
     else:
         start_date = today - timedelta(days=180)  # default
     
-    # Base customer queryset with annotations
-    customers_base = scope_queryset(Customer.objects.all(), request.user, request).annotate(
-        recent_orders_count=Count('orders', filter=Q(orders__created_at__date__gte=start_date)),
-        last_order_date=Max('orders__created_at'),
-        first_order_date=Min('orders__created_at'),
-        service_orders=Count('orders', filter=Q(orders__type='service', orders__created_at__date__gte=start_date)),
-        sales_orders=Count('orders', filter=Q(orders__type='sales', orders__created_at__date__gte=start_date)),
-        inquiry_orders=Count('orders', filter=Q(orders__type='inquiry', orders__created_at__date__gte=start_date)),
-        completed_orders=Count('orders', filter=Q(orders__status='completed', orders__created_at__date__gte=start_date)),
-        cancelled_orders=Count('orders', filter=Q(orders__status='cancelled', orders__created_at__date__gte=start_date)),
-        vehicles_count=Count('vehicles', distinct=True)
+    # Resolve the branch scope once; scope_queryset may look up the ?branch= Branch
+    scoped_customers = scope_queryset(Customer.objects.all(), request.user, request)
+    
+    # Nothing to aggregate for a scope without customers (new branch, unassigned staff)
+    if not scoped_customers.exists():
+        return _empty_customer_groups(selected_group, start_date, today)
+    
+    # Base customer queryset with per-customer metrics. They are correlated subqueries
+    # rather than joined aggregates so they can be summed/filtered per customer_type
+    # in a single GROUP BY below.
+    in_period = {'created_at__date__gte': start_date}
+    customers_base = scoped_customers.annotate(
+        recent_orders_count=_customer_order_count(**in_period),
+        last_order_date=_customer_order_date(Max),
+        first_order_date=_customer_order_date(Min),
+        service_orders=_customer_order_count(type='service', **in_period),
+        sales_orders=_customer_order_count(type='sales', **in_period),
+        inquiry_orders=_customer_order_count(type='inquiry', **in_period),
+        completed_orders=_customer_order_count(status='completed', **in_period),
+        cancelled_orders=_customer_order_count(status='cancelled', **in_period),
+        vehicles_count=_customer_vehicle_count(),
     )
     
     # Get all defined customer types from the model
-    all_customer_types = dict(Customer.TYPE_CHOICES)
+    all_customer_types = _CUSTOMER_TYPE_DICT
     
     # Calculate total customers (all customers in the system)
-    total_customers = scope_queryset(Customer.objects.all(), request.user, request).count()
+    total_customers = scoped_customers.count()
     
     # Calculate active customers this month (customers with orders in the last 30 days)
     one_month_ago = timezone.now() - timedelta(days=30)
-    active_customers_this_month = scope_queryset(Customer.objects.all(), request.user, request).filter(
+    active_customers_this_month = scoped_customers.filter(
         orders__created_at__gte=one_month_ago
     ).distinct().count()
     
     # Customer type groups with detailed analytics
     customer_groups = {}
     
-    # Get customer counts per group for current period
-    current_period_counts = dict(scope_queryset(Customer.objects.all(), request.user, request).values_list('customer_type').annotate(
-        count=Count('id')
-    ).values_list('customer_type', 'count'))
-    
-    # Get customer counts for previous period for growth calculation
+    # Customer counts per group for the current period and, for growth, customers
+    # registered in the previous period of the same length -- one grouped query
     prev_period_start = start_date - (today - start_date)  # Same length as current period
-    prev_period_counts = dict(scope_queryset(Customer.objects.filter(
-        registration_date__lt=start_date,
-        registration_date__gte=prev_period_start
-    ), request.user, request).values_list('customer_type').annotate(
-        count=Count('id')
-    ).values_list('customer_type', 'count'))
-    
+    period_counts = scoped_customers.order_by().values('customer_type').annotate(
+        current=Count('id'),
+        prev=Count('id', filter=Q(registration_date__lt=start_date, registration_date__gte=prev_period_start)),
+    )
+    current_period_counts = {}
+    prev_period_counts = {}
+    for row in period_counts:
+        current_period_counts[row['customer_type']] = row['current']
+        prev_period_counts[row['customer_type']] = row['prev']
+    
+    # Every per-group figure in one GROUP BY customer_type query
+    group_rows = {
+        row['customer_type']: row
+        for row in customers_base.order_by().values('customer_type').annotate(
+            total_revenue=Sum('total_spent'),
+            avg_revenue_per_customer=Avg('total_spent'),
+            avg_orders_per_customer=Avg('recent_orders_count'),
+            avg_order_value=Avg('total_spent'),
+            high_value=Count('id', filter=Q(total_spent__gte=1000)),
+            medium_value=Count('id', filter=Q(total_spent__gte=500, total_spent__lt=1000)),
+            low_value=Count('id', filter=Q(total_spent__lt=500)),
+            very_active=Count('id', filter=Q(recent_orders_count__gte=5)),
+            active=Count('id', filter=Q(recent_orders_count__gte=2, recent_orders_count__lt=5)),
+            inactive=Count('id', filter=Q(recent_orders_count__lt=2)),
+            service_preference=Count('id', filter=Q(service_orders__gt=F('sales_orders'))),
+            sales_preference=Count('id', filter=Q(sales_orders__gt=F('service_orders'))),
+            recent_new_customers=Count('id', filter=Q(registration_date__date__gte=start_date)),
+            returning_customers=Count('id', filter=Q(total_visits__gt=1)),
+        )
+    }
+
+    # Order and vehicle totals are plain aggregates over their own tables; the per-customer
+    # annotations above are only needed for the per-customer segment counts.
+    scoped_customer_ids = scoped_customers.values('pk')
+    order_totals = {}
+    for row in (Order.objects.filter(customer__in=scoped_customer_ids, **in_period)
+                .order_by().values('customer__customer_type').annotate(
+                    total_orders=Count('id'),
+                    total_service_orders=Count('id', filter=Q(type='service')),
+                    total_sales_orders=Count('id', filter=Q(type='sales')),
+                    total_inquiry_orders=Count('id', filter=Q(type='inquiry')),
+                    total_completed_orders=Count('id', filter=Q(status='completed')),
+                    total_cancelled_orders=Count('id', filter=Q(status='cancelled')),
+                )):
+        order_totals[row.pop('customer__customer_type')] = row
+    vehicle_totals = dict(Vehicle.objects.filter(customer__in=scoped_customer_ids)
+                          .order_by().values('customer__customer_type').annotate(n=Count('id'))
+                          .values_list('customer__customer_type', 'n'))
+
+    # Top 5 customers per group by spend, ranked in SQL. Only the displayed columns are
+    # loaded; the per-customer metric subqueries on customers_base are not needed here.
+    top_by_type = {}
+    top_columns = scoped_customers.only('id', 'full_name', 'phone', 'total_spent', 'customer_type')
+    ranked = top_columns.annotate(
+        spend_rank=Window(RowNumber(), partition_by='customer_type', order_by=['-total_spent', 'id'])
+    ).filter(spend_rank__lte=5).order_by('customer_type', 'spend_rank')
+    for customer in ranked:
+        top_by_type.setdefault(customer.customer_type, []).append(customer)
+
     # Process each customer type
     for customer_type, display_name in all_customer_types.items():
-        # Get customers for this group in current period
-        group_customers = customers_base.filter(customer_type=customer_type)
         group_customer_count = current_period_counts.get(customer_type, 0)
         
         # Calculate growth percentage
@@ -2037,93 +2071,23 @@ def customer_groups(request: HttpRequest):
             growth_percent = round(((group_customer_count - prev_count) / prev_count) * 100, 1)
         elif group_customer_count > 0:
             growth_percent = 100  # If no previous customers but have current, show 100% growth
-            
-        # Initialize default values for groups with no customers
-        group_stats = {
-            'total_revenue': 0,
-            'avg_revenue_per_customer': 0,
-            'total_orders': 0,
-            'avg_orders_per_customer': 0,
-            'avg_order_value': 0,
-            'total_service_orders': 0,
-            'total_sales_orders': 0,
-            'total_inquiry_orders': 0,
-            'total_completed_orders': 0,
-            'total_cancelled_orders': 0,
-            'total_vehicles': 0,
+
+        row = {
+            **group_rows.get(customer_type, {}),
+            **order_totals.get(customer_type, {}),
+            'total_vehicles': vehicle_totals.get(customer_type, 0),
         }
-        
-        # If group has customers, get their stats
-        if group_customer_count > 0:
-            group_stats = group_customers.aggregate(
-                total_revenue=Sum('total_spent') or 0,
-                total_orders=Sum('recent_orders_count') or 0,
-                total_service_orders=Sum('service_orders') or 0,
-                total_sales_orders=Sum('sales_orders') or 0,
-                total_inquiry_orders=Sum('inquiry_orders') or 0,
-                total_completed_orders=Sum('completed_orders') or 0,
-                total_cancelled_orders=Sum('cancelled_orders') or 0,
-                total_vehicles=Sum('vehicles_count') or 0,
-            )
-            
-            # Calculate averages
-            group_stats['avg_revenue_per_customer'] = (
-                group_stats['total_revenue'] / group_customer_count 
-                if group_customer_count > 0 else 0
-            )
-            group_stats['avg_orders_per_customer'] = (
-                group_stats['total_orders'] / group_customer_count 
-                if group_customer_count > 0 else 0
-            )
-            group_stats['avg_order_value'] = (
-                group_stats['total_revenue'] / group_stats['total_orders'] 
-                if group_stats['total_orders'] > 0 else 0
-            )
-        
-        # Only calculate metrics if there are customers
-        if total_customers > 0:
-            group_stats = group_customers.aggregate(
-                total_revenue=Sum('total_spent') or 0,
-                avg_revenue_per_customer=Avg('total_spent') or 0,
-                total_orders=Sum('recent_orders_count') or 0,
-                avg_orders_per_customer=Avg('recent_orders_count') or 0,
-                avg_order_value=Avg('total_spent') or 0,
-                total_service_orders=Sum('service_orders') or 0,
-                total_sales_orders=Sum('sales_orders') or 0,
-                total_inquiry_orders=Sum('inquiry_orders') or 0,
-                total_completed_orders=Sum('completed_orders') or 0,
-                total_cancelled_orders=Sum('cancelled_orders') or 0,
-                total_vehicles=Sum('vehicles_count') or 0,
-            )
-        
-        # Customer segmentation within group
-        high_value = group_customers.filter(total_spent__gte=1000).count()
-        medium_value = group_customers.filter(total_spent__gte=500, total_spent__lt=1000).count()
-        low_value = group_customers.filter(total_spent__lt=500).count()
-        
-        # Activity levels
-        very_active = group_customers.filter(recent_orders_count__gte=5).count()
-        active = group_customers.filter(recent_orders_count__gte=2, recent_orders_count__lt=5).count()
-        inactive = group_customers.filter(recent_orders_count__lt=2).count()
-        
-        # Service preferences
-        service_preference = group_customers.filter(service_orders__gt=F('sales_orders')).count()
-        sales_preference = group_customers.filter(sales_orders__gt=F('service_orders')).count()
-        mixed_preference = total_customers - service_preference - sales_preference if total_customers > 0 else 0
-        
-        # Recent activity trends
-        recent_new_customers = group_customers.filter(registration_date__date__gte=start_date).count()
-        returning_customers = group_customers.filter(total_visits__gt=1).count()
+        group_stats = {key: row.get(key) or 0 for key in _CUSTOMER_GROUP_STAT_KEYS}
+        service_preference = row.get('service_preference', 0)
+        sales_preference = row.get('sales_preference', 0)
+        mixed_preference = max(group_customer_count - service_preference - sales_preference, 0)
         
         # Calculate completion rate (completed orders / (completed + cancelled))
-        completed = group_stats.get('total_completed_orders', 0) or 0
-        cancelled = group_stats.get('total_cancelled_orders', 0) or 0
+        completed = group_stats['total_completed_orders']
+        cancelled = group_stats['total_cancelled_orders']
         total_orders_for_completion = completed + cancelled
         completion_rate = (completed / total_orders_for_completion * 100) if total_orders_for_completion > 0 else 0
         
-        # Get top customers in this group (up to 5)
-        top_customers = list(group_customers.order_by('-total_spent')[:5])
-        
         # Add group to results
         customer_groups[customer_type] = {
             'name': display_name,
@@ -2132,14 +2096,14 @@ def customer_groups(request: HttpRequest):
             'growth_percent': growth_percent,
             'stats': group_stats,
             'segmentation': {
-                'high_value': high_value,
-                'medium_value': medium_value,
-                'low_value': low_value,
+                'high_value': row.get('high_value', 0),
+                'medium_value': row.get('medium_value', 0),
+                'low_value': row.get('low_value', 0),
             },
             'activity_levels': {
-                'very_active': very_active,
-                'active': active,
-                'inactive': inactive,
+                'very_active': row.get('very_active', 0),
+                'active': row.get('active', 0),
+                'inactive': row.get('inactive', 0),
             },
             'service_preferences': {
                 'service_preference': service_preference,
@@ -2147,16 +2111,17 @@ def customer_groups(request: HttpRequest):
                 'mixed_preference': mixed_preference,
             },
             'trends': {
-                'recent_new_customers': recent_new_customers,
-                'returning_customers': returning_customers,
+                'recent_new_customers': row.get('recent_new_customers', 0),
+                'returning_customers': row.get('returning_customers', 0),
                 'completion_rate': round(completion_rate, 1) if group_customer_count > 0 else 0,
             },
-            'top_customers': top_customers,
+            'top_customers': top_by_type.get(customer_type, []),
         }
     
     # Overall statistics - use base queryset without any filters for accurate totals
     overall_stats = {
-        'total_revenue': customers_base.aggregate(total=Sum('total_spent'))['total'] or 0,
+        # Every scoped customer falls in exactly one group row (NULL type included)
+        'total_revenue': sum(row['total_revenue'] or 0 for row in group_rows.values()),
         'total_orders': customers_base.aggregate(total=Count('orders'))['total'] or 0,
     }
     
@@ -2198,29 +2163,36 @@ def customer_groups(request: HttpRequest):
     # Get detailed customer list for selected group
     detailed_customers = []
     selected_group_display = ''
-    if selected_group != 'all' and selected_group in dict(Customer.TYPE_CHOICES):
+    if selected_group != 'all' and selected_group in _CUSTOMER_TYPE_DICT:
         detailed_customers = customers_base.filter(customer_type=selected_group).order_by(sort_by)[:50]
-        selected_group_display = dict(Customer.TYPE_CHOICES).get(selected_group, selected_group)
+        selected_group_display = _CUSTOMER_TYPE_DICT.get(selected_group, selected_group)
     
     # Monthly trends for charts
     monthly_trends = {}
     monthly_charts = {}
     monthly_chart_data = {}
     
+    # Completed months are read from the rollup table (rebuild_monthly_rollup); months after
+    # the last rolled-up one are aggregated live from Order. Series start on a month boundary.
+    trend_start = start_date.replace(day=1)
+    live_start = trend_start
+    last_rolled = MonthlyCustomerTypeRollup.objects.aggregate(last=Max('month'))['last']
+    if last_rolled:
+        live_start = max(trend_start, (last_rolled.replace(day=28) + timedelta(days=4)).replace(day=1))
+    monthly_by_type = {}
+    rolled_rows = (MonthlyCustomerTypeRollup.objects
+                   .filter(customer_type__in=all_customer_types, month__gte=trend_start, month__lt=live_start)
+                   .values('customer_type', 'month', 'orders', 'customers'))
+    for row in rolled_rows:
+        monthly_by_type.setdefault(row.pop('customer_type'), []).append(row)
+    live_rows = monthly_order_counts(
+        customer__customer_type__in=all_customer_types, created_at__date__gte=live_start
+    )
+    for row in live_rows:
+        monthly_by_type.setdefault(row.pop('customer__customer_type'), []).append(row)
+
     for customer_type, display_name in Customer.TYPE_CHOICES:
-        # Get monthly order data
-        monthly_data = (Order.objects
-                       .filter(customer__customer_type=customer_type, created_at__date__gte=start_date)
-                       .annotate(month=TruncMonth('created_at'))
-                       .values('month')
-                       .annotate(
-                           orders=Count('id'),
-                           customers=Count('customer', distinct=True)
-                       )
-                       .order_by('month'))
-        
-        # Convert QuerySet to list of dicts for the template
-        monthly_data_list = list(monthly_data)
+        monthly_data_list = monthly_by_type.get(customer_type, [])
         
         # Store the raw data
         monthly_trends[customer_type] = {
@@ -2243,73 +2215,138 @@ def customer_groups(request: HttpRequest):
             )
             monthly_charts[customer_type] = chart_image
     
-    # Initialize variables with default values if not defined
-    total_revenue = getattr(customers_base.aggregate(total=Sum('total_spent')), 'total', 0) or 0
-    total_orders = getattr(customers_base.aggregate(total=Count('orders')), 'total', 0) or 0
+    # Headline totals were already computed for overall_stats
+    total_revenue = overall_stats['total_revenue']
+    total_orders = overall_stats['total_orders']
+    
+    # Calculate growth percentages with proper default values
+    revenue_growth = 0
+    orders_growth = 0
+    customers_growth = 0
+    
+    return {
+        'customer_groups': customer_groups,
+        'overall_stats': overall_stats,
+        'selected_group_display': selected_group_display,
+        'detailed_customers': list(detailed_customers),
+        'monthly_trends': monthly_trends,
+        'monthly_charts': monthly_charts,
+        'monthly_chart_data': monthly_chart_data,
+        'chart_image': chart_image if 'chart_image' in locals() else None,
+        'start_date': start_date,
+        'end_date': today,
+        'total_customers': total_customers,
+        'active_customers_this_month': active_customers_this_month,
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'revenue_growth': revenue_growth,
+        'orders_growth': orders_growth,
+        'customers_growth': customers_growth,
+    }
+
+
+@login_required
+def customer_groups(request: HttpRequest):
+    """Advanced customer groups page with detailed analytics and insights"""
+    
+    # Handle AJAX requests
+    # If this is an AJAX request to load a group's detail partial, we must NOT early-return here.
+    # Only delegate to the JSON data endpoint when it's an AJAX request without load_group=1.
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' and request.GET.get('load_group') != '1':
+        return customer_groups_data(request)
+        
+    # Get filter parameters
+    selected_group = request.GET.get('group', 'all')
+    time_period = request.GET.get('period', '6months')
+    sort_by = request.GET.get('sort')
+    
+    # Set default sort if not provided or empty
+    if not sort_by:
+        sort_by = 'total_spent'
+    
+    # Validate sort field
+    valid_sort_fields = [
+        'total_spent', 'recent_orders_count', 'last_order_date', 'first_order_date',
+        'service_orders', 'sales_orders', 'inquiry_orders', 'completed_orders',
+        'cancelled_orders', 'vehicles_count'
+    ]
+    
+    # Extract field name and direction
+    sort_field = sort_by.lstrip('-')
+    sort_direction = '-' if sort_by.startswith('-') else ''
     
-    # Calculate growth percentages with proper default values
-    revenue_growth = 0
-    orders_growth = 0
-    customers_growth = 0
+    # Validate sort field
+    if sort_field not in valid_sort_fields:
+        sort_field = 'total_spent'
+        sort_direction = '-'
     
-    # Prepare context for the template
-    context = {
-        'customer_groups': customer_groups,
-        'selected_group': selected_group,
-        'time_period': time_period,
-        'sort_by': sort_by,
-        'selected_group_display': selected_group_display,
-        'detailed_customers': detailed_customers,
-        'total_customers': total_customers or 0,
-        'total_revenue': total_revenue,
-        'total_orders': total_orders,
-        'revenue_growth': revenue_growth,
-        'orders_growth': orders_growth,
-        'customers_growth': customers_growth,
-        'chart_image': chart_image if 'chart_image' in locals() else None,
-    }
+    sort_by = f"{sort_direction}{sort_field}"
+    
+    # Cache the whole computation; Customer/Order signals bump the key version
+    cache_key = customer_groups_cache_key(
+        request.user.pk, request.GET.get('branch', ''), selected_group, time_period, sort_by
+    )
+    data = cache.get_or_set(
+        cache_key,
+        lambda: _compute_customer_groups(request, selected_group, time_period, sort_by),
+        CUSTOMER_GROUPS_TTL,
+    )
+    customer_groups = data['customer_groups']
     
     # If it's an AJAX request, return JSON response
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         # If frontend requested to load a single group's detail HTML, return rendered partial
         if request.GET.get('load_group') == '1' and selected_group and selected_group != 'all':
+            context = {
+                'customer_groups': customer_groups,
+                'selected_group': selected_group,
+                'time_period': time_period,
+                'sort_by': sort_by,
+                'selected_group_display': data['selected_group_display'],
+                'detailed_customers': data['detailed_customers'],
+                'total_customers': data['total_customers'] or 0,
+                'total_revenue': data['total_revenue'],
+                'total_orders': data['total_orders'],
+                'revenue_growth': data['revenue_growth'],
+                'orders_growth': data['orders_growth'],
+                'customers_growth': data['customers_growth'],
+                'chart_image': data['chart_image'],
+            }
             html = render_to_string('tracker/partials/customer_group_detail.html', context, request=request)
             return JsonResponse({'success': True, 'html': html})
 
-        from django.core import serializers
-
         # Convert the context to a JSON-serializable format
         response_data = {
             'customer_groups': customer_groups,
-            'total_customers': total_customers,
-            'total_revenue': float(total_revenue) if total_revenue else 0,
-            'total_orders': total_orders,
-            'revenue_growth': float(revenue_growth) if revenue_growth else 0,
-            'orders_growth': float(orders_growth) if orders_growth else 0,
-            'customers_growth': float(customers_growth) if customers_growth else 0,
+            'total_customers': data['total_customers'],
+            'total_revenue': float(data['total_revenue']) if data['total_revenue'] else 0,
+            'total_orders': data['total_orders'],
+            'revenue_growth': float(data['revenue_growth']) if data['revenue_growth'] else 0,
+            'orders_growth': float(data['orders_growth']) if data['orders_growth'] else 0,
+            'customers_growth': float(data['customers_growth']) if data['customers_growth'] else 0,
         }
-        return JsonResponse(response_data)
+        return OrjsonResponse(response_data)
     
     # Define active groups (groups with customers)
-    active_groups = [group for group, data in customer_groups.items() if data['total_customers'] > 0]
+    active_groups = [group for group, group_data in customer_groups.items() if group_data['total_customers'] > 0]
     
     # For regular requests, render the full template
     context = {
         'customer_groups': customer_groups,
-        'overall_stats': overall_stats,
+        'overall_stats': data['overall_stats'],
         'selected_group': selected_group,
-        'selected_group_display': selected_group_display,
+        'selected_group_display': data['selected_group_display'],
         'time_period': time_period,
         'sort_by': sort_by,
-        'detailed_customers': detailed_customers,
-        'monthly_trends': monthly_trends,
-        'monthly_charts': monthly_charts,
-        'monthly_chart_data': json.dumps(monthly_chart_data),  # Client-side chart payload
+        'detailed_customers': data['detailed_customers'],
+        'monthly_trends': data['monthly_trends'],
+        'monthly_charts': data['monthly_charts'],
+        'monthly_chart_data': json.dumps(data['monthly_chart_data']),  # Client-side chart payload
         'customer_type_choices': Customer.TYPE_CHOICES,
-        'start_date': start_date,
-        'end_date': today,
-        'total_customers': total_customers,
-        'active_customers_this_month': active_customers_this_month,
+        'start_date': data['start_date'],
+        'end_date': data['end_date'],
+        'total_customers': data['total_customers'],
+        'active_customers_this_month': data['active_customers_this_month'],
         'active_groups': active_groups,  # List of group codes with customers
     }
     
@@ -2353,22 +2390,36 @@ def api_customer_groups_data(request: HttpRequest):
     total_orders = 0
     total_revenue = 0
     
+    # Per-customer metrics as correlated subqueries, shared by every group below
+    annotated_customers = Customer.objects.annotate(
+        total_orders=_customer_order_count(),
+        recent_orders=_customer_order_count(created_at__date__gte=start_date),
+        service_orders=_customer_order_count(type='service'),
+        sales_orders=_customer_order_count(type='sales'),
+        inquiry_orders=_customer_order_count(type='inquiry'),
+        completed_orders=_customer_order_count(status='completed'),
+        last_order_date=_customer_order_date(Max),
+        vehicles_count=_customer_vehicle_count()
+    )
+    
+    # Every group's totals summed in SQL in one GROUP BY, without loading customer rows
+    group_totals = {
+        row['customer_type']: row
+        for row in annotated_customers.filter(customer_type__in=customer_types)
+        .order_by().values('customer_type').annotate(
+            customer_count=Count('id'),
+            group_orders=Sum('total_orders'),
+            group_revenue=Sum('total_spent'),
+        )
+    }
+    
     for customer_type in customer_types:
         # Get customers for this group
-        customers = Customer.objects.filter(customer_type=customer_type).annotate(
-            total_orders=Count('orders'),
-            recent_orders=Count('orders', filter=Q(orders__created_at__date__gte=start_date)),
-            service_orders=Count('orders', filter=Q(orders__type='service')),
-            sales_orders=Count('orders', filter=Q(orders__type='sales')),
-            inquiry_orders=Count('orders', filter=Q(orders__type='inquiry')),
-            completed_orders=Count('orders', filter=Q(orders__status='completed')),
-            last_order_date=Max('orders__created_at'),
-            vehicles_count=Count('vehicles', distinct=True)
-        )
-        
-        customer_count = customers.count()
-        group_orders = sum(c.total_orders for c in customers) or 0
-        group_revenue = sum(float(c.total_spent or 0) for c in customers) or 0
+        customers = annotated_customers.filter(customer_type=customer_type)
+        totals = group_totals.get(customer_type, {})
+        customer_count = totals.get('customer_count') or 0
+        group_orders = totals.get('group_orders') or 0
+        group_revenue = float(totals.get('group_revenue') or 0)
         
         # Calculate averages
         avg_orders = group_orders / customer_count if customer_count > 0 else 0
@@ -2380,7 +2431,7 @@ def api_customer_groups_data(request: HttpRequest):
         ))
         
         groups_data[customer_type] = {
-            'name': dict(Customer.TYPE_CHOICES)[customer_type],
+            'name': _CUSTOMER_TYPE_DICT[customer_type],
             'customer_count': customer_count,
             'total_orders': group_orders,
             'total_revenue': float(group_revenue),
@@ -2396,16 +2447,7 @@ def api_customer_groups_data(request: HttpRequest):
     # If specific group requested, get detailed data
     group_details = None
     if group != 'all' and group in customer_types:
-        customers = Customer.objects.filter(customer_type=group).annotate(
-            total_orders=Count('orders'),
-            recent_orders=Count('orders', filter=Q(orders__created_at__date__gte=start_date)),
-            service_orders=Count('orders', filter=Q(orders__type='service')),
-            sales_orders=Count('orders', filter=Q(orders__type='sales')),
-            inquiry_orders=Count('orders', filter=Q(orders__type='inquiry')),
-            completed_orders=Count('orders', filter=Q(orders__status='completed')),
-            last_order_date=Max('orders__created_at'),
-            vehicles_count=Count('vehicles', distinct=True)
-        ).order_by('-total_spent')
+        customers = annotated_customers.filter(customer_type=group).order_by('-total_spent')
         
         group_details = {
             'customers': list(customers.values(
@@ -2416,7 +2458,7 @@ def api_customer_groups_data(request: HttpRequest):
             'stats': groups_data.get(group, {})
         }
     
-    return JsonResponse({
+    return OrjsonResponse({
         'success': True,
         'groups': groups_data,
         'totals': {
@@ -2431,7 +2473,7 @@ def api_customer_groups_data(request: HttpRequest):
 @login_required
 def customer_groups_data(request: HttpRequest):
     """API endpoint for AJAX requests to get customer groups data"""
-    from django.db.models import Count, Sum, Avg, Q, F
+    from django.db.models import Count, Sum, Avg, Max, Q, F
     from datetime import datetime, timedelta
     
     # Get filter parameters
@@ -2457,14 +2499,16 @@ def customer_groups_data(request: HttpRequest):
     else:
         start_date = datetime(2000, 1, 1)  # All time
     
-    # Base query for customers
-    customers = Customer.objects.all()
+    # Base query for customers; per-row order figures are annotated once instead of queried per row
+    customers = Customer.objects.annotate(
+        recent_orders_count=Count('orders'),
+        last_order_date=Max('orders__created_at'),
+    )
     
     # Apply search filter
     if search_value:
         customers = customers.filter(
-            Q(first_name__icontains=search_value) |
-            Q(last_name__icontains=search_value) |
+            Q(full_name__icontains=search_value) |
             Q(phone__icontains=search_value) |
             Q(email__icontains=search_value)
         )
@@ -2472,10 +2516,8 @@ def customer_groups_data(request: HttpRequest):
     # Apply group filter
     if selected_group and selected_group != 'all':
         if selected_group == 'high_value':
-            customers = customers.annotate(
-                order_count=Count('orders')
-            ).filter(
-                order_count__gt=0,
+            customers = customers.filter(
+                recent_orders_count__gt=0,
                 total_spent__gt=1000  # Example threshold for high-value
             )
         elif selected_group == 'inactive':
@@ -2495,20 +2537,15 @@ def customer_groups_data(request: HttpRequest):
     for customer in customers:
         data.append({
             'id': customer.id,
-            'full_name': f"{customer.first_name} {customer.last_name}",
+            'full_name': customer.full_name,
             'phone': customer.phone,
             'email': customer.email,
             'total_spent': float(customer.total_spent) if customer.total_spent else 0,
-            'recent_orders_count': customer.orders.count(),
+            'recent_orders_count': customer.recent_orders_count,
             'last_order_date': customer.last_order_date.strftime('%Y-%m-%d') if customer.last_order_date else 'N/A',
-            'actions': f'''
-                <a href="/customer/{customer.id}/" class="btn btn-sm btn-primary">
-                    <i class="fas fa-eye"></i> View
-                </a>
-                <a href="/customer/{customer.id}/edit/" class="btn btn-sm btn-secondary">
-                    <i class="fas fa-edit"></i> Edit
-                </a>
-            '''
+            # Detail and edit page URLs for this customer
+            'detail_url': _detail_url('tracker:customer_detail', customer.id),
+            'edit_url': _detail_url('tracker:customer_edit', customer.id),
         })
     
     # Prepare response
@@ -2519,11 +2556,11 @@ def customer_groups_data(request: HttpRequest):
         'data': data,
     }
     
-    return JsonResponse(response)
+    return OrjsonResponse(response)
 
 @login_required
 def orders_list(request: HttpRequest):
-    from django.db.models import Q, Sum
+    from django.db.models import Count, Q, Sum
 
     # Persist overdue statuses before listing
     _mark_overdue_orders(hours=24)
@@ -2537,7 +2574,8 @@ def orders_list(request: HttpRequest):
     date_range = request.GET.get("date_range", "")
     customer_id = request.GET.get("customer", "")
 
-    orders = scope_queryset(Order.objects.select_related("customer", "vehicle").order_by("-created_at"), request.user, request)
+    # The list only renders customer fields; no vehicle or reverse relations are read per row
+    orders = scope_queryset(Order.objects.select_related("customer").order_by("-created_at"), request.user, request)
 
     # Apply filters
     if status == "overdue":
@@ -2566,14 +2604,22 @@ def orders_list(request: HttpRequest):
         start_year = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
         orders = orders.filter(created_at__gte=start_year)
 
-    # Get counts for stats
-    total_orders = scope_queryset(Order.objects.all(), request.user, request).count()
-    pending_orders = scope_queryset(Order.objects.filter(status="created"), request.user, request).count()
-    active_orders = scope_queryset(Order.objects.filter(status__in=["created", "in_progress", "overdue"]), request.user, request).count()
-    completed_today = scope_queryset(Order.objects.filter(status="completed", completed_at__date=timezone.localdate()), request.user, request).count()
-    urgent_orders = scope_queryset(Order.objects.filter(priority="urgent"), request.user, request).count()
-    # Overdue KPI: respect user branch scoping and optional admin branch filter
-    overdue_count = scope_queryset(Order.objects.filter(status="overdue"), request.user, request).count()
+    # Get counts for stats in one conditional aggregate; KPIs respect user branch
+    # scoping and the optional admin branch filter
+    kpi = scope_queryset(Order.objects.all(), request.user, request).aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=Q(status="created")),
+        active=Count("id", filter=Q(status__in=["created", "in_progress", "overdue"])),
+        completed_today=Count("id", filter=Q(status="completed", completed_at__date=timezone.localdate())),
+        urgent=Count("id", filter=Q(priority="urgent")),
+        overdue=Count("id", filter=Q(status="overdue")),
+    )
+    total_orders = kpi["total"]
+    pending_orders = kpi["pending"]
+    active_orders = kpi["active"]
+    completed_today = kpi["completed_today"]
+    urgent_orders = kpi["urgent"]
+    overdue_count = kpi["overdue"]
     revenue_today = 0
 
     paginator = Paginator(orders, 20)
@@ -2595,49 +2641,16 @@ def orders_list(request: HttpRequest):
     })
     # Support GET ?customer=<id> to go straight into order form for that customer
     if request.method == 'GET':
+        # Service types and add-ons are loaded once for either form variant
+        ctx = _service_catalog_context()
+        form = OrderForm()
         cust_id = request.GET.get('customer')
         if cust_id:
             c = get_object_or_404(Customer, pk=cust_id)
-            form = OrderForm()
             form.fields['vehicle'].queryset = c.vehicles.all()
-            # Provide dynamic service types and add-ons
-            try:
-                from .models import ServiceType, ServiceAddon
-                svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-                addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-                service_types = [{
-                    'name': s.name,
-                    'estimated_minutes': int(s.estimated_minutes or 0)
-                } for s in svc_qs]
-                sales_addons = [{
-                    'name': a.name,
-                    'estimated_minutes': int(a.estimated_minutes or 0)
-                } for a in addon_qs]
-            except Exception:
-                service_types = []
-                sales_addons = []
-            return render(request, "tracker/order_create.html", {"customer": c, "form": form, "service_types": service_types, "sales_addons": sales_addons})
-        form = OrderForm()
-        try:
-            form.fields['vehicle'].queryset = Vehicle.objects.none()
-        except Exception:
-            pass
-        try:
-            from .models import ServiceType, ServiceAddon
-            svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-            addon_qs = ServiceAddon.objects.filter(is_active=True).order_by('name')
-            service_types = [{
-                'name': s.name,
-                'estimated_minutes': int(s.estimated_minutes or 0)
-            } for s in svc_qs]
-            sales_addons = [{
-                'name': a.name,
-                'estimated_minutes': int(a.estimated_minutes or 0)
-            } for a in addon_qs]
-        except Exception:
-            service_types = []
-            sales_addons = []
-        return render(request, "tracker/order_create.html", {"form": form, "service_types": service_types, "sales_addons": sales_addons})
+            return render(request, "tracker/order_create.html", {**ctx, "customer": c, "form": form})
+        form.fields['vehicle'].queryset = Vehicle.objects.none()
+        return render(request, "tracker/order_create.html", {**ctx, "form": form})
 
     # Handle POST (AJAX or standard form submit)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -2660,6 +2673,7 @@ def orders_list(request: HttpRequest):
             'follow_up_date': request.POST.get('follow_up_date') or None,
         }
         vehicle_id = request.POST.get('vehicle')
+        new_vehicle = None
         if vehicle_id:
             vehicle = get_object_or_404(Vehicle, id=vehicle_id, customer=customer)
             order_data['vehicle'] = vehicle
@@ -2670,16 +2684,9 @@ def orders_list(request: HttpRequest):
             model = request.POST.get('model', '').strip()
             vehicle_type = request.POST.get('vehicle_type', '').strip()
             
-            # Create vehicle if any vehicle information is provided
+            # Create vehicle if any vehicle information is provided (once validation passed)
             if plate_number or make or model or vehicle_type:
-                vehicle = Vehicle.objects.create(
-                    customer=customer,
-                    plate_number=plate_number or None,
-                    make=make or None,
-                    model=model or None,
-                    vehicle_type=vehicle_type or None
-                )
-                order_data['vehicle'] = vehicle
+                new_vehicle = (plate_number, make, model, vehicle_type)
         if order_data.get('type') == 'sales':
             item_id = (order_data.get('item_name') or '').strip()
             try:
@@ -2698,23 +2705,29 @@ def orders_list(request: HttpRequest):
                 order_data['quantity'] = qty
             except InventoryItem.DoesNotExist:
                 return JsonResponse({'success': False, 'message': 'Selected item not found in inventory', 'code': 'not_found'})
-        order = Order.objects.create(**order_data)
-        # Update customer visit/arrival status for returning tracking
-        try:
-            now_ts = timezone.now()
-            customer.arrival_time = now_ts
-            customer.current_status = 'arrived'
-            customer.last_visit = now_ts
-            customer.total_visits = (customer.total_visits or 0) + 1
-            customer.save(update_fields=['arrival_time','current_status','last_visit','total_visits'])
-        except Exception:
-            pass
         remaining = None
-        if order.type == 'sales':
-            from .utils import adjust_inventory
-            qty_int = int(order.quantity or 0)
-            ok, status, rem = adjust_inventory(order.item_name, order.brand, -qty_int)
-            remaining = rem if ok else None
+        # Vehicle, order, visit stats and stock deduction commit together
+        with transaction.atomic():
+            if new_vehicle:
+                order_data['vehicle'] = _order_vehicle(customer, *new_vehicle)
+            order = Order.objects.create(**order_data)
+            # Update customer visit/arrival status for returning tracking in one UPDATE;
+            # the visit counter is incremented in SQL so concurrent orders don't race
+            try:
+                now_ts = timezone.now()
+                with transaction.atomic():
+                    Customer.objects.filter(pk=customer.pk).update(
+                        arrival_time=now_ts,
+                        current_status='arrived',
+                        last_visit=now_ts,
+                        total_visits=F('total_visits') + 1,
+                    )
+            except DatabaseError:
+                logger.warning("Failed to update visit status for customer %s", customer.pk, exc_info=True)
+            if order.type == 'sales':
+                qty_int = int(order.quantity or 0)
+                ok, status, rem = adjust_inventory_by_id(item.pk, -qty_int)
+                remaining = rem if ok else None
         return JsonResponse({'success': True, 'message': 'Order created successfully', 'order_id': order.id, 'remaining': remaining})
 
     # Standard form submit (non-AJAX)
@@ -2731,24 +2744,6 @@ def orders_list(request: HttpRequest):
         o.customer = c
         o.status = 'created'
         
-        # Handle vehicle creation if new vehicle info is provided
-        if not o.vehicle:
-            plate_number = request.POST.get('plate_number', '').strip()
-            make = request.POST.get('make', '').strip()
-            model = request.POST.get('model', '').strip()
-            vehicle_type = request.POST.get('vehicle_type', '').strip()
-            
-            # Create vehicle if any vehicle information is provided
-            if plate_number or make or model or vehicle_type:
-                v = Vehicle.objects.create(
-                    customer=c,
-                    plate_number=plate_number or None,
-                    make=make or None,
-                    model=model or None,
-                    vehicle_type=vehicle_type or None
-                )
-                o.vehicle = v
-        
         # Sales inventory validation - item_name and brand are already set by form.clean()
         if o.type == 'sales':
             name = (o.item_name or '').strip()
@@ -2757,18 +2752,30 @@ def orders_list(request: HttpRequest):
             if not name or not brand or qty <= 0:
                 messages.error(request, 'Item selection and valid quantity are required')
                 return render(request, "tracker/order_create.html", {"customer": c, "form": form})
-        o.save()
-        # Update customer visit/arrival status for returning tracking
-        try:
-            c.arrival_time = timezone.now()
-            c.current_status = 'arrived'
-            c.save(update_fields=['arrival_time','current_status'])
-        except Exception:
-            pass
+        # Vehicle, order, arrival status and stock deduction commit together
+        with transaction.atomic():
+            # Handle vehicle creation if new vehicle info is provided
+            if not o.vehicle:
+                plate_number = request.POST.get('plate_number', '').strip()
+                make = request.POST.get('make', '').strip()
+                model = request.POST.get('model', '').strip()
+                vehicle_type = request.POST.get('vehicle_type', '').strip()
+
+                # Create vehicle if any vehicle information is provided
+                if plate_number or make or model or vehicle_type:
+                    v = _order_vehicle(c, plate_number, make, model, vehicle_type)
+                    o.vehicle = v
+            o.save()
+            # Update customer visit/arrival status for returning tracking
+            try:
+                with transaction.atomic():
+                    Customer.objects.filter(pk=c.pk).update(arrival_time=timezone.now(), current_status='arrived')
+            except DatabaseError:
+                logger.warning("Failed to update arrival status for customer %s", c.pk, exc_info=True)
+            if o.type == 'sales':
+                qty_int = int(o.quantity or 0)
+                ok, status, remaining = adjust_inventory_by_id(form.inventory_item_id, -qty_int)
         if o.type == 'sales':
-            from .utils import adjust_inventory
-            qty_int = int(o.quantity or 0)
-            ok, status, remaining = adjust_inventory(o.item_name, o.brand, -qty_int)
             if ok:
                 messages.success(request, f"Order created. Remaining stock for {o.item_name} ({o.brand}): {remaining}")
             else:
@@ -2783,7 +2790,7 @@ def orders_list(request: HttpRequest):
 @login_required
 def order_edit(request: HttpRequest, pk: int):
     """Edit an existing order"""
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related('customer'), pk=pk)
     
     if request.method == 'POST':
         form = OrderForm(request.POST, instance=order)
@@ -2793,19 +2800,12 @@ def order_edit(request: HttpRequest, pk: int):
                 service_selection = request.POST.getlist('service_selection')
                 if service_selection:
                     # Update description with selected services
-                    desc = order.description or ""
                     desc_services = "Selected services: " + ", ".join(service_selection)
-                    if desc:
-                        desc = desc + "\n" + desc_services
-                    else:
-                        desc = desc_services
-                    form.instance.description = desc
+                    form.instance.description = "\n".join(filter(None, [order.description, desc_services]))
                     
                     # Update estimated duration based on selected services
                     try:
-                        from .models import ServiceType
-                        service_types = ServiceType.objects.filter(name__in=service_selection, is_active=True)
-                        total_minutes = sum(int(s.estimated_minutes or 0) for s in service_types)
+                        total_minutes = catalog_minutes(get_service_types(), service_selection)
                         form.instance.estimated_duration = total_minutes or 50
                     except Exception:
                         pass
@@ -2815,19 +2815,12 @@ def order_edit(request: HttpRequest, pk: int):
                 tire_services = request.POST.getlist('tire_services')
                 if tire_services:
                     # Update description with selected tire services
-                    desc = order.description or ""
                     desc_services = "Tire services: " + ", ".join(tire_services)
-                    if desc:
-                        desc = desc + "\n" + desc_services
-                    else:
-                        desc = desc_services
-                    form.instance.description = desc
+                    form.instance.description = "\n".join(filter(None, [order.description, desc_services]))
                     
                     # Update estimated duration based on selected tire services
                     try:
-                        from .models import ServiceAddon
-                        addons = ServiceAddon.objects.filter(name__in=tire_services, is_active=True)
-                        total_minutes = sum(int(a.estimated_minutes or 0) for a in addons)
+                        total_minutes = catalog_minutes(get_service_addons(), tire_services)
                         # Add to existing estimated duration if it exists
                         current_duration = order.estimated_duration or 0
                         form.instance.estimated_duration = current_duration + total_minutes
@@ -2854,7 +2847,10 @@ def order_edit(request: HttpRequest, pk: int):
 @login_required
 def order_delete(request: HttpRequest, pk: int):
     """Delete an order"""
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(
+        Order.objects.select_related('customer').only('id', 'order_number', 'customer__id', 'customer__full_name'),
+        pk=pk,
+    )
     customer = order.customer
     
     if request.method == 'POST':
@@ -2885,7 +2881,12 @@ def order_delete(request: HttpRequest, pk: int):
 
 @login_required
 def customer_detail(request: HttpRequest, pk: int):
-    customers_qs = scope_queryset(Customer.objects.all(), request.user, request)
+    # Orders (with their vehicle) and vehicles are prefetched once; the template
+    # counts, slices and loops over the same cached lists
+    customers_qs = scope_queryset(Customer.objects.all(), request.user, request).prefetch_related(
+        Prefetch('orders', queryset=Order.objects.select_related('vehicle').order_by('-created_at')),
+        'vehicles',
+    )
     try:
         customer = customers_qs.get(pk=pk)
     except Customer.DoesNotExist:
@@ -2893,15 +2894,25 @@ def customer_detail(request: HttpRequest, pk: int):
         messages.warning(request, "Customer not found or you don't have permission to view this customer.")
         return redirect('tracker:customers_list')
 
-    orders = customer.orders.all().order_by('-created_at')
+    orders = customer.orders.all()
     vehicles = customer.vehicles.all()
     notes = customer.note_entries.all().order_by('-created_at')
 
+    # Status chart counts come from a single conditional aggregate
+    counts = scope_queryset(Order.objects.filter(customer=customer), request.user, request).aggregate(
+        **{code: Count("id", filter=Q(status=code)) for code, _ in Order.STATUS_CHOICES}
+    )
+    cd_status = {
+        "labels": [code.replace("_", " ").title() for code, _ in Order.STATUS_CHOICES if counts[code]],
+        "values": [counts[code] for code, _ in Order.STATUS_CHOICES if counts[code]],
+    }
+
     return render(request, "tracker/customer_detail.html", {
         'customer': customer,
         'orders': orders,
         'vehicles': vehicles,
         'notes': notes,
+        'cd_status': _dumps(cd_status),
     })
 
 
@@ -2913,7 +2924,7 @@ def request_customer_access(request: HttpRequest, pk: int):
     - Shows an informative message and redirects to customers list.
     """
     try:
-        customer = Customer.objects.get(pk=pk)
+        customer = Customer.objects.only('id', 'full_name', 'branch').get(pk=pk)
     except Customer.DoesNotExist:
         messages.error(request, "Customer not found.")
         return redirect('tracker:customers_list')
@@ -2934,14 +2945,16 @@ def request_customer_access(request: HttpRequest, pk: int):
     try:
         from django.core.mail import send_mail
         from django.conf import settings
-        branch_users = User.objects.filter(profile__branch=customer.branch, is_active=True)
-        emails = [u.email for u in branch_users if u.email]
+        emails = list(
+            User.objects.filter(profile__branch_id=customer.branch_id, is_active=True)
+            .exclude(email='').values_list('email', flat=True).distinct()
+        )
         if emails:
             subject = f"Access request for customer {customer.full_name}"
             body = f"User {request.user.get_full_name() or request.user.username} has requested access to customer {customer.full_name} (ID: {customer.id}).\n\nPlease review and grant access if appropriate."
             from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None) or None
             try:
-                send_mail(subject, body, from_email, list(set(emails)), fail_silently=True)
+                send_mail(subject, body, from_email, emails, fail_silently=True)
                 notified = len(emails)
             except Exception:
                 notified = 0
@@ -2958,7 +2971,11 @@ def request_customer_access(request: HttpRequest, pk: int):
 
 @login_required
 def order_detail(request: HttpRequest, pk: int):
-    orders_qs = scope_queryset(Order.objects.all(), request.user, request)
+    # The detail page renders customer, vehicle, signer and the attachment list
+    orders_qs = scope_queryset(
+        Order.objects.select_related('customer', 'vehicle', 'signed_by').prefetch_related('attachments'),
+        request.user, request,
+    )
     order = get_object_or_404(orders_qs, pk=pk)
     # Auto-progress created -> in_progress after 10 minutes
     try:
@@ -2974,8 +2991,7 @@ def order_detail(request: HttpRequest, pk: int):
 def update_order_status(request: HttpRequest, pk: int):
     """Manual status transitions to in_progress are disabled; progression is automatic.
     Use complete_order or cancel_order endpoints for finalization."""
-    orders_qs2 = scope_queryset(Order.objects.all(), request.user, request)
-    o = get_object_or_404(orders_qs2, pk=pk)
+    o = get_object_or_404(_order_base_qs(request, fields=('id',)), pk=pk)
     messages.error(request, "Order status to In Progress is managed automatically after 10 minutes. Use Complete or Cancel for final steps.")
     return redirect("tracker:order_detail", pk=o.id)
 
@@ -2986,8 +3002,8 @@ def complete_order(request: HttpRequest, pk: int):
     Accepts either a file upload for signature or a base64-encoded 'signature_data' image.
     Computes duration and adjusts inventory for sales."""
 
-    orders_qs3 = scope_queryset(Order.objects.all(), request.user, request)
-    o = get_object_or_404(orders_qs3, pk=pk)
+    # The long free-text columns are never read or changed while completing an order
+    o = get_object_or_404(_order_base_qs(request).defer('description', 'questions', 'cancellation_reason'), pk=pk)
     if request.method != 'POST':
         return redirect('tracker:order_detail', pk=o.id)
 
@@ -3014,93 +3030,70 @@ def complete_order(request: HttpRequest, pk: int):
     doc_kind = (request.POST.get('completion_doc_type') or '').strip().lower()
     is_job_card = doc_kind in {'job_card', 'jobcard', 'job card'}
 
-    # Server-side validation rules
-    ALLOWED_ATTACHMENT_EXTS = ['.jpg','.jpeg','.png','.gif','.webp','.pdf','.doc','.docx','.xls','.xlsx','.txt']
-    ALLOWED_SIGNATURE_EXTS = ['.jpg','.jpeg','.png','.webp']
-    MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024  # 10 MB
-    MAX_SIGNATURE_BYTES = 2 * 1024 * 1024  # 2 MB
-
     signature_bytes = None
 
-    def _ext_of_name(name):
-        try:
-            return ('.' + name.split('.')[-1].lower()) if '.' in name else ''
-        except Exception:
-            return ''
+    sig_name = sig.name if sig else None
 
-    # If signature file missing but signature_data exists, decode it into an uploaded file
+    # If signature file missing but signature_data exists, keep the decoded bytes;
+    # they are only wrapped in a file when assigned to the order below
     if not sig and sig_data.startswith('data:image/') and ';base64,' in sig_data:
         try:
             header, b64 = sig_data.split(';base64,', 1)
             ext = (header.split('/')[-1] or 'png').split(';')[0]
             signature_bytes = base64.b64decode(b64)
-            if len(signature_bytes) > MAX_SIGNATURE_BYTES:
+            if len(signature_bytes) > _MAX_SIGNATURE_BYTES:
                 messages.error(request, 'Signature image is too large.')
                 return redirect('tracker:order_detail', pk=o.id)
-            sig = ContentFile(signature_bytes, name=f"signature_{o.id}_{int(time.time())}.{ext}")
+            sig_name = f"signature_{o.id}_{int(time.time())}.{ext}"
         except Exception:
-            sig = None
+            signature_bytes = None
 
-    # If a signature file was uploaded directly, validate size/type and capture bytes
-    if sig and hasattr(sig, 'name'):
-        s_ext = _ext_of_name(sig.name)
-        if s_ext not in ALLOWED_SIGNATURE_EXTS:
+    # Validate signature type, and size for uploaded files
+    if sig_name:
+        s_ext = _ext_of_name(sig_name)
+        if s_ext not in _ALLOWED_SIGNATURE_EXTS:
             messages.error(request, 'Invalid signature file type. Use PNG or JPG.')
             return redirect('tracker:order_detail', pk=o.id)
-        if hasattr(sig, 'size') and sig.size > MAX_SIGNATURE_BYTES:
+        if sig and hasattr(sig, 'size') and sig.size > _MAX_SIGNATURE_BYTES:
             messages.error(request, 'Signature file too large (max 2MB).')
             return redirect('tracker:order_detail', pk=o.id)
-        if signature_bytes is None:
-            try:
-                sig.seek(0)
-            except Exception:
-                pass
+
+    if not sig_name:
+        messages.error(request, 'Please draw a signature to complete the order.')
+        return redirect('tracker:order_detail', pk=o.id)
+
+    # Read an uploaded signature once; every embed below reuses these bytes
+    if signature_bytes is None:
+        try:
+            sig.seek(0)
             signature_bytes = sig.read()
+        except Exception:
+            signature_bytes = None
         try:
             sig.seek(0)
         except Exception:
             pass
 
-    if not sig:
-        messages.error(request, 'Please draw a signature to complete the order.')
-        return redirect('tracker:order_detail', pk=o.id)
-
     # Validate completion attachment if present and embed signature when appropriate
     signed_attachment = None
     if att:
         a_ext = _ext_of_name(att.name)
-        if a_ext not in ALLOWED_ATTACHMENT_EXTS:
+        if a_ext not in _ALLOWED_ATTACHMENT_EXTS:
             messages.error(request, 'Unsupported attachment type. Allowed: images, PDF, Office documents, text.')
             return redirect('tracker:order_detail', pk=o.id)
-        if hasattr(att, 'size') and att.size > MAX_ATTACHMENT_BYTES:
+        if hasattr(att, 'size') and att.size > _MAX_ATTACHMENT_BYTES:
             messages.error(request, 'Attachment too large (max 10MB).')
             return redirect('tracker:order_detail', pk=o.id)
-        image_exts = {'.jpg','.jpeg','.png','.gif','.webp'}
         if a_ext == '.pdf':
-            if signature_bytes is None:
-                try:
-                    sig.seek(0)
-                    signature_bytes = sig.read()
-                except Exception:
-                    signature_bytes = None
-                finally:
-                    try:
-                        sig.seek(0)
-                    except Exception:
-                        pass
             if not signature_bytes:
                 messages.error(request, 'Could not access the signature image for PDF embedding.')
                 return redirect('tracker:order_detail', pk=o.id)
             try:
-                try:
-                    att.seek(0)
-                except Exception:
-                    pass
-                pdf_bytes = att.read()
+                # The embedder reads the uploaded file directly; it is not copied into memory first
                 if is_job_card:
-                    signed_pdf_bytes = embed_signature_in_pdf(pdf_bytes, signature_bytes, preset='job_card')
+                    signed_pdf_bytes = embed_signature_in_pdf(att, signature_bytes, preset='job_card')
                 else:
-                    signed_pdf_bytes = embed_signature_in_pdf(pdf_bytes, signature_bytes)
+                    signed_pdf_bytes = embed_signature_in_pdf(att, signature_bytes)
                 signed_name = build_signed_filename(att.name)
                 signed_attachment = ContentFile(signed_pdf_bytes, name=signed_name)
             except SignatureEmbedError as exc:
@@ -3109,31 +3102,15 @@ def complete_order(request: HttpRequest, pk: int):
             except Exception:
                 messages.error(request, 'Could not embed the signature into the PDF document.')
                 return redirect('tracker:order_detail', pk=o.id)
-        elif a_ext in image_exts:
-            if signature_bytes is None:
-                try:
-                    sig.seek(0)
-                    signature_bytes = sig.read()
-                except Exception:
-                    signature_bytes = None
-                finally:
-                    try:
-                        sig.seek(0)
-                    except Exception:
-                        pass
+        elif a_ext in _IMAGE_EXTS:
             if not signature_bytes:
                 messages.error(request, 'Could not access the signature image for embedding.')
                 return redirect('tracker:order_detail', pk=o.id)
             try:
-                try:
-                    att.seek(0)
-                except Exception:
-                    pass
-                img_bytes = att.read()
                 if is_job_card:
-                    out_bytes = embed_signature_in_image(img_bytes, signature_bytes, preset='job_card')
+                    out_bytes = embed_signature_in_image(att, signature_bytes, preset='job_card')
                 else:
-                    out_bytes = embed_signature_in_image(img_bytes, signature_bytes)
+                    out_bytes = embed_signature_in_image(att, signature_bytes)
                 out_name = build_signed_name(att.name)
                 signed_attachment = ContentFile(out_bytes, name=out_name)
             except SignatureEmbedError as exc:
@@ -3153,11 +3130,14 @@ def complete_order(request: HttpRequest, pk: int):
         o.started_at = now
         o.status = 'in_progress'
 
-    try:
-        sig.seek(0)
-    except Exception:
-        pass
-    o.signature_file = sig
+    if sig:
+        try:
+            sig.seek(0)
+        except Exception:
+            pass
+        o.signature_file = sig
+    else:
+        o.signature_file = ContentFile(signature_bytes, name=sig_name)
     if signed_attachment is not None:
         o.completion_attachment = signed_attachment
     elif att:
@@ -3171,79 +3151,65 @@ def complete_order(request: HttpRequest, pk: int):
     reference_time = o.started_at or o.created_at
     o.actual_duration = int(max(0, (now - reference_time).total_seconds() // 60))
 
-    if o.type == 'sales' and (o.quantity or 0) > 0 and o.item_name and o.brand:
-        from .utils import adjust_inventory
-        adjust_inventory(o.item_name, o.brand, (o.quantity or 0))
-
-    # Auto-embed signature into already uploaded attachments (PDF/images)
+    # Auto-embed signature into already uploaded attachments (PDF/images). The embedding
+    # runs before the transaction below so no locks are held while documents are rendered
+    signed_outputs = []
     try:
-        sig_bytes_for_embed = signature_bytes
-        if sig_bytes_for_embed is None and sig:
-            try:
-                sig.seek(0)
-                sig_bytes_for_embed = sig.read()
-            except Exception:
-                sig_bytes_for_embed = None
-        if sig_bytes_for_embed is None and o.signature_file:
-            try:
-                o.signature_file.open('rb')
-                sig_bytes_for_embed = o.signature_file.read()
-            except Exception:
-                sig_bytes_for_embed = None
-            finally:
-                try:
-                    o.signature_file.close()
-                except Exception:
-                    pass
-        signed_created = 0
-        if sig_bytes_for_embed:
-            image_exts = {'.jpg','.jpeg','.png','.gif','.webp'}
-            for att_item in o.attachments.all():
+        if signature_bytes:
+            # Stream only the columns the embed needs ('order' too: the related manager assigns
+            # it back to every row). Signed copies are written after the loop so the
+            # attachments table is not modified while it is being iterated
+            for att_item in o.attachments.only('id', 'order', 'file', 'title').iterator(chunk_size=20):
                 name = att_item.file.name or ''
                 lower = name.lower()
-                try:
-                    att_item.file.open('rb')
-                    src_bytes = att_item.file.read()
-                except Exception:
+                ext = _ext_of_name(lower)
+                if ext != '.pdf' and ext not in _IMAGE_EXTS:
                     continue
-                finally:
-                    try:
-                        att_item.file.close()
-                    except Exception:
-                        pass
+                preset = 'job_card' if (('job' in lower and 'card' in lower) or is_job_card) else None
                 try:
-                    if lower.endswith('.pdf'):
-                        if ('job' in lower and 'card' in lower) or is_job_card:
-                            out_bytes = embed_signature_in_pdf(src_bytes, sig_bytes_for_embed, preset='job_card')
-                        else:
-                            out_bytes = embed_signature_in_pdf(src_bytes, sig_bytes_for_embed)
-                        out_name = build_signed_filename(name)
-                    elif any(lower.endswith(ext) for ext in image_exts):
-                        if ('job' in lower and 'card' in lower) or is_job_card:
-                            out_bytes = embed_signature_in_image(src_bytes, sig_bytes_for_embed, preset='job_card')
+                    # Hand the open storage file to the embedder instead of reading it into memory
+                    with att_item.file.storage.open(name, 'rb') as fh:
+                        if ext == '.pdf':
+                            out_bytes = embed_signature_in_pdf(fh, signature_bytes, preset=preset)
+                            out_name = build_signed_filename(name)
                         else:
-                            out_bytes = embed_signature_in_image(src_bytes, sig_bytes_for_embed)
-                        out_name = build_signed_name(name)
-                    else:
-                        continue
-                    OrderAttachment.objects.create(
-                        order=o,
-                        file=ContentFile(out_bytes, name=out_name),
-                        uploaded_by=request.user,
-                        title=(att_item.title or att_item.filename()) + " (Signed)"
-                    )
-                    signed_created += 1
+                            out_bytes = embed_signature_in_image(fh, signature_bytes, preset=preset)
+                            out_name = build_signed_name(name)
+                    signed_outputs.append((out_bytes, out_name, (att_item.title or att_item.filename()) + " (Signed)"))
                 except Exception:
                     continue
-        if signed_created:
-            try:
-                add_audit_log(request.user, 'attachments_signed', f"Signed {signed_created} attachment(s) for order {o.order_number}")
-            except Exception:
-                pass
     except Exception:
         pass
 
-    o.save()
+    # Inventory, signed copies and the completed order commit together; adjust_inventory
+    # and the signed-copy insert each run in their own savepoint so a failure there
+    # cannot break the outer transaction
+    signed_created = 0
+    with transaction.atomic():
+        if o.type == 'sales' and (o.quantity or 0) > 0 and o.item_name and o.brand:
+            adjust_inventory(o.item_name, o.brand, (o.quantity or 0))
+        if signed_outputs:
+            try:
+                with transaction.atomic():
+                    # FileField.pre_save runs during bulk_create, so each ContentFile is still written to storage
+                    OrderAttachment.objects.bulk_create([
+                        OrderAttachment(
+                            order=o,
+                            file=ContentFile(out_bytes, name=out_name),
+                            uploaded_by=request.user,
+                            title=title
+                        )
+                        for out_bytes, out_name, title in signed_outputs
+                    ], batch_size=50)
+                signed_created = len(signed_outputs)
+            except Exception:
+                logger.warning("Could not store signed attachments for order %s", o.pk, exc_info=True)
+        o.save()
+    if signed_created:
+        try:
+            add_audit_log(request.user, 'attachments_signed', f"Signed {signed_created} attachment(s) for order {o.order_number}")
+        except Exception:
+            pass
     try:
         add_audit_log(request.user, 'order_completed', f"Order {o.order_number} completed with digital signature")
     except Exception:
@@ -3269,14 +3235,10 @@ def sign_order_document(request: HttpRequest, pk: int):
     if not pdf_file or not signature_payload:
         return JsonResponse({'success': False, 'error': 'PDF document and signature are required.'}, status=400)
 
-    MAX_PDF_BYTES = 10 * 1024 * 1024  # 10 MB
-    MAX_SIGNATURE_BYTES = 2 * 1024 * 1024  # 2 MB
-
-    filename_lower = (pdf_file.name or '').lower()
-    if not filename_lower.endswith('.pdf'):
+    if _ext_of_name(pdf_file.name) != '.pdf':
         return JsonResponse({'success': False, 'error': 'Only PDF documents can be signed.'}, status=400)
 
-    if hasattr(pdf_file, 'size') and pdf_file.size and pdf_file.size > MAX_PDF_BYTES:
+    if hasattr(pdf_file, 'size') and pdf_file.size and pdf_file.size > _MAX_ATTACHMENT_BYTES:
         return JsonResponse({'success': False, 'error': 'PDF exceeds maximum size of 10MB.'}, status=400)
 
     def _decode_signature(payload: str) -> bytes:
@@ -3295,20 +3257,15 @@ def sign_order_document(request: HttpRequest, pk: int):
     except ValueError as exc:
         return JsonResponse({'success': False, 'error': str(exc)}, status=400)
 
-    if len(signature_bytes) > MAX_SIGNATURE_BYTES:
+    if len(signature_bytes) > _MAX_SIGNATURE_BYTES:
         return JsonResponse({'success': False, 'error': 'Signature image is too large (max 2MB).'}, status=400)
 
     try:
-        try:
-            pdf_file.seek(0)
-        except Exception:
-            pass
-        pdf_bytes = pdf_file.read()
         preset = 'job_card' if (request.POST.get('completion_doc_type') or '').strip().lower() in {'job_card','jobcard','job card'} else None
         if preset:
-            signed_pdf_bytes = embed_signature_in_pdf(pdf_bytes, signature_bytes, preset=preset)
+            signed_pdf_bytes = embed_signature_in_pdf(pdf_file, signature_bytes, preset=preset)
         else:
-            signed_pdf_bytes = embed_signature_in_pdf(pdf_bytes, signature_bytes)
+            signed_pdf_bytes = embed_signature_in_pdf(pdf_file, signature_bytes)
     except SignatureEmbedError as exc:
         return JsonResponse({'success': False, 'error': str(exc)}, status=400)
     except Exception:
@@ -3316,11 +3273,12 @@ def sign_order_document(request: HttpRequest, pk: int):
 
     signed_name = build_signed_filename(pdf_file.name)
 
-    signed_content = ContentFile(signed_pdf_bytes, name=signed_name)
-    order.completion_attachment.save(signed_name, signed_content, save=False)
-
-    signature_file_name = f"signature_{order.id}_{int(time.time())}.png"
-    order.signature_file.save(signature_file_name, ContentFile(signature_bytes), save=False)
+    # Final storage names are reserved now so the response can carry the document URL;
+    # the bytes are written once the order update commits
+    write_signed_pdf = _deferred_file_save(order, 'completion_attachment', signed_name, signed_pdf_bytes)
+    write_signature = _deferred_file_save(
+        order, 'signature_file', f"signature_{order.id}_{int(time.time())}.png", signature_bytes
+    )
 
     now = timezone.now()
     if not order.started_at:
@@ -3334,23 +3292,28 @@ def sign_order_document(request: HttpRequest, pk: int):
     order.signed_by = request.user
     order.signed_at = now
 
-    if order.type == 'sales' and (order.quantity or 0) > 0 and order.item_name and order.brand:
-        from .utils import adjust_inventory
-        adjust_inventory(order.item_name, order.brand, (order.quantity or 0))
+    response = HttpResponse(signed_pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{signed_name}"'
+    try:
+        response['X-Signed-Document-URL'] = order.completion_attachment.url
+    except Exception:
+        response['X-Signed-Document-URL'] = ''
 
-    order.save(update_fields=['status', 'completed_at', 'completion_date', 'actual_duration', 'signed_by', 'signed_at'])
+    with transaction.atomic():
+        if order.type == 'sales' and (order.quantity or 0) > 0 and order.item_name and order.brand:
+            adjust_inventory(order.item_name, order.brand, (order.quantity or 0))
+        order.save(update_fields=[
+            'status', 'started_at', 'completed_at', 'completion_date', 'actual_duration',
+            'signed_by', 'signed_at', 'completion_attachment', 'signature_file',
+        ])
+        transaction.on_commit(write_signed_pdf)
+        transaction.on_commit(write_signature)
 
     try:
         add_audit_log(request.user, 'order_completed', f"Order {order.order_number} signed and archived as PDF")
     except Exception:
         pass
 
-    response = HttpResponse(signed_pdf_bytes, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{signed_name}"'
-    try:
-        response['X-Signed-Document-URL'] = order.completion_attachment.url
-    except Exception:
-        response['X-Signed-Document-URL'] = ''
     return response
 
 
@@ -3376,40 +3339,22 @@ def sign_existing_document(request: HttpRequest, pk: int):
         messages.error(request, 'Signature is required.')
         return redirect('tracker:order_detail', pk=order.id)
 
-    # Resolve source document
-    src_bytes = None
-    src_name = None
+    # Resolve source document; it is opened only once the signature is known to be valid
     if attachment_id:
         try:
             att = get_object_or_404(OrderAttachment, pk=int(attachment_id), order=order)
         except Exception:
             messages.error(request, 'Attachment not found for this order.')
             return redirect('tracker:order_detail', pk=order.id)
-        try:
-            att.file.open('rb')
-            src_bytes = att.file.read()
-            src_name = att.file.name or 'document'
-        finally:
-            try:
-                att.file.close()
-            except Exception:
-                pass
+        source = att.file
     elif order.completion_attachment:
-        try:
-            order.completion_attachment.open('rb')
-            src_bytes = order.completion_attachment.read()
-            src_name = order.completion_attachment.name or 'document'
-        finally:
-            try:
-                order.completion_attachment.close()
-            except Exception:
-                pass
+        source = order.completion_attachment
     else:
         messages.error(request, 'No document selected to sign.')
         return redirect('tracker:order_detail', pk=order.id)
+    src_name = source.name or 'document'
 
-    lower = (src_name or '').lower()
-    is_pdf = lower.endswith('.pdf')
+    is_pdf = _ext_of_name(src_name) == '.pdf'
 
     # Decode signature
     try:
@@ -3421,20 +3366,17 @@ def sign_existing_document(request: HttpRequest, pk: int):
         messages.error(request, 'Invalid signature payload.')
         return redirect('tracker:order_detail', pk=order.id)
 
-    if len(signature_bytes) > (2 * 1024 * 1024):
+    if len(signature_bytes) > _MAX_SIGNATURE_BYTES:
         messages.error(request, 'Signature image is too large (max 2MB).')
         return redirect('tracker:order_detail', pk=order.id)
 
-    # Perform embedding
+    # Perform embedding, streaming the stored document into the embedder
     try:
-        if is_pdf:
-            out = embed_signature_in_pdf(src_bytes, signature_bytes, preset='job_card' if use_job_card else None)
-            out_name = build_signed_filename(src_name)
-            out_content = ContentFile(out, name=out_name)
-        else:
-            out = embed_signature_in_image(src_bytes, signature_bytes, preset='job_card' if use_job_card else None)
-            out_name = build_signed_name(src_name)
-            out_content = ContentFile(out, name=out_name)
+        embed = embed_signature_in_pdf if is_pdf else embed_signature_in_image
+        with source.open('rb') as fh:
+            out = embed(fh, signature_bytes, preset='job_card' if use_job_card else None)
+        out_name = build_signed_filename(src_name) if is_pdf else build_signed_name(src_name)
+        out_content = ContentFile(out, name=out_name)
     except SignatureEmbedError as exc:
         messages.error(request, str(exc))
         return redirect('tracker:order_detail', pk=order.id)
@@ -3457,7 +3399,7 @@ def sign_existing_document(request: HttpRequest, pk: int):
     order.actual_duration = int(max(0, (now - reference_time).total_seconds() // 60))
     order.signed_by = request.user
     order.signed_at = now
-    order.save(update_fields=['status', 'started_at', 'completed_at', 'completion_date', 'actual_duration', 'signed_by', 'signed_at'])
+    order.save(update_fields=['status', 'started_at', 'completed_at', 'completion_date', 'actual_duration', 'signed_by', 'signed_at', 'signature_file'])
 
     messages.success(request, 'Signed copy created and attached to the order.')
     return redirect('tracker:order_detail', pk=order.id)
@@ -3466,8 +3408,10 @@ def sign_existing_document(request: HttpRequest, pk: int):
 @login_required
 def cancel_order(request: HttpRequest, pk: int):
     """Cancel an order with a required reason."""
-    orders_qs4 = scope_queryset(Order.objects.all(), request.user, request)
-    o = get_object_or_404(orders_qs4, pk=pk)
+    o = get_object_or_404(
+        _order_base_qs(request, fields=('id', 'order_number', 'type', 'status', 'cancelled_at', 'cancellation_reason')),
+        pk=pk,
+    )
     if request.method != 'POST':
         return redirect('tracker:order_detail', pk=o.id)
     # Disallow cancelling inquiries — they are auto-completed on creation
@@ -3505,22 +3449,13 @@ def add_order_attachments(request: HttpRequest, pk: int):
     added = 0
     skipped = 0
 
-    ALLOWED_ATTACHMENT_EXTS = ['.jpg','.jpeg','.png','.gif','.webp','.pdf','.doc','.docx','.xls','.xlsx','.txt']
-    MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024  # 10 MB
-
-    def _ext_of_name(name):
-        try:
-            return ('.' + name.split('.')[-1].lower()) if '.' in name else ''
-        except Exception:
-            return ''
-
     for f in files:
         try:
             ext = _ext_of_name(f.name)
-            if ext not in ALLOWED_ATTACHMENT_EXTS:
+            if ext not in _ALLOWED_ATTACHMENT_EXTS:
                 skipped += 1
                 continue
-            if hasattr(f, 'size') and f.size > MAX_ATTACHMENT_BYTES:
+            if hasattr(f, 'size') and f.size > _MAX_ATTACHMENT_BYTES:
                 skipped += 1
                 continue
             OrderAttachment.objects.create(order=o, file=f, uploaded_by=request.user)
@@ -3591,9 +3526,12 @@ def analytics(request: HttpRequest):
         labels = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30)]
 
     qs = scope_queryset(Order.objects.filter(created_at__date__gte=start_date, created_at__date__lte=end_date), request.user, request)
-    status_counts = {row['status']: row['c'] for row in qs.values('status').annotate(c=Count('id'))}
-    type_counts = {row['type']: row['c'] for row in qs.values('type').annotate(c=Count('id'))}
-    priority_counts = {row['priority']: row['c'] for row in qs.values('priority').annotate(c=Count('id'))}
+    # One grouped pass feeds the status/type/priority charts and the totals
+    status_counts, type_counts, priority_counts = {}, {}, {}
+    for row in qs.order_by().values('status', 'type', 'priority').annotate(c=Count('id')):
+        status_counts[row['status']] = status_counts.get(row['status'], 0) + row['c']
+        type_counts[row['type']] = type_counts.get(row['type'], 0) + row['c']
+        priority_counts[row['priority']] = priority_counts.get(row['priority'], 0) + row['c']
 
     # Trend by selected period
     if period == 'daily':
@@ -3652,9 +3590,9 @@ def analytics(request: HttpRequest):
     }
 
     totals = {
-        'total_orders': qs.count(),
-        'completed': qs.filter(status='completed').count(),
-        'in_progress': qs.filter(status__in=['created','in_progress']).count(),
+        'total_orders': sum(status_counts.values()),
+        'completed': status_counts.get('completed', 0),
+        'in_progress': status_counts.get('created', 0) + status_counts.get('in_progress', 0),
         'customers': scope_queryset(Customer.objects.filter(registration_date__date__range=[start_date, end_date]), request.user, request).count(),
     }
 
@@ -3669,7 +3607,6 @@ def analytics(request: HttpRequest):
 
 @login_required
 def reports(request: HttpRequest):
-    from datetime import date, timedelta
     from django.db.models import Count
     from django.db.models.functions import TruncDate
     import json
@@ -3697,57 +3634,38 @@ def reports(request: HttpRequest):
             f_from = f_from or start.isoformat()
             f_to = f_to or today.isoformat()
     qs = scope_queryset(Order.objects.select_related("customer").order_by("-created_at"), request.user, request)
-    if f_from:
-        try:
-            from datetime import datetime
-            # Try multiple date formats
-            for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%m/%d/%Y']:
-                try:
-                    start_date = datetime.strptime(f_from, fmt).date()
-                    qs = qs.filter(created_at__date__gte=start_date)
-                    break
-                except ValueError:
-                    continue
-        except Exception:
-            pass
-    if f_to:
-        try:
-            from datetime import datetime
-            # Try multiple date formats
-            for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%m/%d/%Y']:
-                try:
-                    end_date = datetime.strptime(f_to, fmt).date()
-                    qs = qs.filter(created_at__date__lte=end_date)
-                    break
-                except ValueError:
-                    continue
-        except Exception:
-            pass
+    start_date = _parse_user_date(f_from) if f_from else None
+    end_date = _parse_user_date(f_to) if f_to else None
+    if start_date:
+        qs = qs.filter(created_at__date__gte=start_date)
+    if end_date:
+        qs = qs.filter(created_at__date__lte=end_date)
     if f_type and f_type != "all":
         qs = qs.filter(type=f_type)
 
-    # Align with dashboard approach for status counts
-    status_counts_qs = qs.values("status").annotate(c=Count("id"))
-    status_counts = {x["status"]: x["c"] for x in status_counts_qs}
-    
-    # Ensure all possible status values exist in status_counts (even if zero)
-    all_statuses = ["created", "in_progress", "overdue", "completed", "cancelled"]
-    for status in all_statuses:
-        if status not in status_counts:
-            status_counts[status] = 0
-
-    # Break down counts by status correctly
-    completed_count = status_counts.get("completed", 0)
-    created_count = status_counts.get("created", 0)
-    in_progress_count = status_counts.get("in_progress", 0)
-    cancelled_count = status_counts.get("cancelled", 0)
-    overdue_count = status_counts.get("overdue", 0)
+    # KPI cards and status/type charts come from one conditional aggregate
+    totals = qs.order_by().aggregate(
+        total=Count('id'),
+        created=Count('id', filter=Q(status='created')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+        completed=Count('id', filter=Q(status='completed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        overdue=Count('id', filter=Q(status='overdue')),
+        service=Count('id', filter=Q(type='service')),
+        sales=Count('id', filter=Q(type='sales')),
+        inquiry=Count('id', filter=Q(type='inquiry')),
+    )
+    completed_count = totals['completed']
+    created_count = totals['created']
+    in_progress_count = totals['in_progress']
+    cancelled_count = totals['cancelled']
+    overdue_count = totals['overdue']
 
     # Align 'in_progress' metric with dashboard: consider both 'created' and 'in_progress' as active
-    active_in_progress = (created_count or 0) + (in_progress_count or 0)
+    active_in_progress = created_count + in_progress_count
 
     stats = {
-        "total": qs.count(),
+        "total": totals['total'],
         "completed": completed_count,
         "in_progress": active_in_progress,  # This combines created + in_progress
         "created": created_count,
@@ -3755,8 +3673,12 @@ def reports(request: HttpRequest):
     }
 
     # Charts (trend/status/type) for selected range
-    # Build per-day totals and per-status series
-    trend_total_map = {row['day']: row['c'] for row in qs.annotate(day=TruncDate('created_at')).values('day').annotate(c=Count('id'))}
+    # Build per-day totals and per-status series from one grouped query
+    by_day = {}
+    trend_total_map = {}
+    for row in qs.order_by().annotate(day=TruncDate('created_at')).values('day', 'status').annotate(c=Count('id')):
+        by_day.setdefault(row['day'], {})[row['status']] = row['c']
+        trend_total_map[row['day']] = trend_total_map.get(row['day'], 0) + row['c']
 
     labels = []
     total_values = []
@@ -3766,17 +3688,8 @@ def reports(request: HttpRequest):
     cancelled_values = []
 
     days_list = []
-    if f_from and f_to:
-        try:
-            from datetime import date, timedelta
-            start = date.fromisoformat(f_from)
-            end = date.fromisoformat(f_to)
-            days = (end - start).days
-            for i in range(days + 1):
-                d = start + timedelta(days=i)
-                days_list.append(d)
-        except Exception:
-            pass
+    if start_date and end_date:
+        days_list = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
     if not days_list:
         days_list = sorted(trend_total_map.keys())
 
@@ -3784,19 +3697,11 @@ def reports(request: HttpRequest):
         label = d.isoformat() if hasattr(d, 'isoformat') else str(d)
         labels.append(label)
         total_values.append(trend_total_map.get(d, 0))
-        # For each status compute count for orders created on that day
-        try:
-            created_values.append(qs.filter(created_at__date=d, status='created').count())
-            in_progress_values.append(qs.filter(created_at__date=d, status='in_progress').count())
-            completed_values.append(qs.filter(created_at__date=d, status='completed').count())
-            cancelled_values.append(qs.filter(created_at__date=d, status='cancelled').count())
-        except Exception:
-            created_values.append(0)
-            in_progress_values.append(0)
-            completed_values.append(0)
-            cancelled_values.append(0)
-
-    type_counts = {row['type']: row['c'] for row in qs.values('type').annotate(c=Count('id'))}
+        day_counts = by_day.get(d, {})
+        created_values.append(day_counts.get('created', 0))
+        in_progress_values.append(day_counts.get('in_progress', 0))
+        completed_values.append(day_counts.get('completed', 0))
+        cancelled_values.append(day_counts.get('cancelled', 0))
 
     # For consistency between KPI cards and charts, we need to adjust the chart data
     # KPI shows "in_progress" as created + in_progress combined
@@ -3815,9 +3720,9 @@ def reports(request: HttpRequest):
         'type': {
             'labels': ['Service','Sales','Inquiry'],
             'values': [
-                type_counts.get('service',0),
-                type_counts.get('sales',0),
-                type_counts.get('inquiry',0),
+                totals['service'],
+                totals['sales'],
+                totals['inquiry'],
             ]
         },
         'trend': {
@@ -3847,13 +3752,14 @@ def reports(request: HttpRequest):
         },
     )
 
+
 @login_required
 def reports_export(request: HttpRequest):
     # Same filters as reports
     f_from = request.GET.get("from")
     f_to = request.GET.get("to")
     f_type = request.GET.get("type", "all")
-    qs = scope_queryset(Order.objects.select_related("customer").order_by("-created_at"), request.user, request)
+    qs = scope_queryset(Order.objects.order_by("-created_at"), request.user, request)
     if f_from:
         try:
             qs = qs.filter(created_at__date__gte=f_from)
@@ -3867,15 +3773,21 @@ def reports_export(request: HttpRequest):
     if f_type and f_type != "all":
         qs = qs.filter(type=f_type)
 
-    # Build CSV
+    # Stream CSV rows as the cursor yields them
     import csv
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="orders_report.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["Order", "Customer", "Type", "Status", "Priority", "Created At"])
-    for o in qs.iterator():
-        writer.writerow([o.order_number, o.customer.full_name, o.type, o.status, o.priority, o.created_at.isoformat()])
-    return response
+    writer = csv.writer(_Echo())
+
+    def csv_rows():
+        yield writer.writerow(["Order", "Customer", "Type", "Status", "Priority", "Created At"])
+        rows = qs.values_list("order_number", "customer__full_name", "type", "status", "priority", "created_at")
+        for number, customer_name, type_, status, priority, created_at in rows.iterator(chunk_size=2000):
+            yield writer.writerow([number, customer_name, type_, status, priority, created_at.isoformat()])
+
+    return StreamingHttpResponse(
+        csv_rows(),
+        content_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="orders_report.csv"'},
+    )
 
 
 @login_required
@@ -3890,7 +3802,7 @@ def reports_export_pdf(request: HttpRequest):
     f_from = request.GET.get("from")
     f_to = request.GET.get("to")
     f_type = request.GET.get("type", "all")
-    qs = scope_queryset(Order.objects.select_related("customer").order_by("-created_at"), request.user, request)
+    qs = scope_queryset(Order.objects.order_by("-created_at"), request.user, request)
     if f_from:
         try:
             qs = qs.filter(created_at__date__gte=f_from)
@@ -3920,8 +3832,9 @@ def reports_export_pdf(request: HttpRequest):
 
     # Table data
     data = [["Order", "Customer", "Type", "Status", "Priority", "Created At"]]
-    for o in qs.iterator():
-        data.append([o.order_number, o.customer.full_name, o.type, o.status, o.priority, o.created_at.strftime('%Y-%m-%d %H:%M')])
+    rows = qs.values_list("order_number", "customer__full_name", "type", "status", "priority", "created_at")
+    for number, customer_name, type_, status, priority, created_at in rows.iterator(chunk_size=2000):
+        data.append([number, customer_name, type_, status, priority, created_at.strftime('%Y-%m-%d %H:%M')])
 
     # Add a simple status pie chart (ReportLab graphics) above the table
     try:
@@ -4066,7 +3979,7 @@ def customer_groups_export(request: HttpRequest):
         completed_orders=Count('orders', filter=Q(orders__status='completed', orders__created_at__date__gte=start_date)),
         vehicles_count=Count('vehicles', distinct=True),
     )
-    if selected_group and selected_group in dict(Customer.TYPE_CHOICES):
+    if selected_group and selected_group in _CUSTOMER_TYPE_DICT:
         qs = qs.filter(customer_type=selected_group)
     import csv
     resp = HttpResponse(content_type='text/csv')
@@ -4171,8 +4084,8 @@ def api_check_customer_duplicate(request: HttpRequest):
         "tax_number": c.tax_number or "",
         "total_visits": c.total_visits,
         "last_visit": c.last_visit.isoformat() if c.last_visit else "",
-        "detail_url": reverse("tracker:customer_detail", kwargs={"pk": c.id}),
-        "create_order_url": reverse("tracker:create_order_for_customer", kwargs={"pk": c.id}),
+        "detail_url": _detail_url("tracker:customer_detail", c.id),
+        "create_order_url": _detail_url("tracker:create_order_for_customer", c.id),
     }
     return JsonResponse({"exists": True, "customer": data})
 
@@ -4824,16 +4737,8 @@ def inventory_list(request: HttpRequest):
             # Invalid brand ID, ignore the filter
             pass
     
-    # Get distinct active brands for filter dropdown
-    # Cache this queryset since it's used in the template
-    from django.core.cache import cache
-    cache_key = 'active_brands_list'
-    brands = cache.get(cache_key)
-    
-    if brands is None:
-        brands = list(Brand.objects.filter(is_active=True).order_by('name').values('id', 'name'))
-        # Cache for 1 hour
-        cache.set(cache_key, brands, 3600)
+    # Active brands for the filter dropdown (cached, cleared on Brand changes)
+    brands = get_active_brands()
     
     # Paginate results
     items_per_page = 20
@@ -4878,7 +4783,6 @@ def inventory_create(request: HttpRequest):
         form = InventoryItemForm(request.POST)
         if form.is_valid():
             item = form.save()
-            from .utils import clear_inventory_cache
             clear_inventory_cache(item.name, item.brand)
             try:
                 add_audit_log(request.user, 'inventory_create', f"Item '{item.name}' ({item.brand or 'Unbranded'}) qty={item.quantity}")
@@ -4901,7 +4805,6 @@ def inventory_edit(request: HttpRequest, pk: int):
         form = InventoryItemForm(request.POST, instance=item)
         if form.is_valid():
             item = form.save()
-            from .utils import clear_inventory_cache
             clear_inventory_cache(item.name, item.brand)
             try:
                 add_audit_log(request.user, 'inventory_update', f"Item '{item.name}' ({item.brand or 'Unbranded'}) now qty={item.quantity}")
@@ -4920,7 +4823,6 @@ def inventory_edit(request: HttpRequest, pk: int):
 def inventory_delete(request: HttpRequest, pk: int):
     item = get_object_or_404(InventoryItem, pk=pk)
     if request.method == 'POST':
-        from .utils import clear_inventory_cache
         name, brand = item.name, item.brand
         item.delete()
         clear_inventory_cache(name, brand)
@@ -5190,8 +5092,7 @@ def customers_quick_create(request: HttpRequest):
                 return JsonResponse({'success': False, 'message': 'Name and phone are required'})
 
             # Normalize phone number (remove all non-digit characters)
-            import re
-            normalized_phone = re.sub(r'\D', '', phone)
+            normalized_phone = _NON_DIGIT_RE.sub('', phone)
             
             # Check for existing customers with similar name and phone (scope to user's accessible customers)
             existing_customers = scope_queryset(Customer.objects.filter(full_name__iexact=full_name), request.user, request)
@@ -5199,7 +5100,7 @@ def customers_quick_create(request: HttpRequest):
             # Check each potential match for phone number similarity
             for customer in existing_customers:
                 # Normalize stored phone number for comparison
-                stored_phone = re.sub(r'\D', '', str(customer.phone))
+                stored_phone = _NON_DIGIT_RE.sub('', str(customer.phone))
                 # Check for exact or partial match (at least 6 digits matching)
                 if len(normalized_phone) >= 6 and len(stored_phone) >= 6:
                     if normalized_phone in stored_phone or stored_phone in normalized_phone:
@@ -5212,7 +5113,6 @@ def customers_quick_create(request: HttpRequest):
                         })
 
             # Create customer (assign to user's branch if applicable)
-            from .utils import get_user_branch
             customer_branch = get_user_branch(request.user)
             customer = Customer.objects.create(
                 full_name=full_name,
@@ -5459,24 +5359,38 @@ def reports_advanced(request: HttpRequest):
     qs = scope_queryset(Order.objects.filter(created_at__gte=start_dt, created_at__lt=end_dt), request.user, request)
     cqs = scope_queryset(Customer.objects.filter(registration_date__gte=start_dt, registration_date__lt=end_dt), request.user, request)
 
-    # Base statistics
-    total_orders = qs.count()
+    # Base statistics: one conditional aggregate per table
+    order_totals = qs.aggregate(
+        total=Count('id'),
+        created=Count('id', filter=Q(status='created')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        service=Count('id', filter=Q(type='service')),
+        sales=Count('id', filter=Q(type='sales')),
+        inquiry=Count('id', filter=Q(type='inquiry')),
+        avg_duration=Avg('actual_duration'),
+    )
+    customer_totals = cqs.aggregate(
+        total=Count('id'),
+        personal=Count('id', filter=Q(customer_type='personal')),
+        company=Count('id', filter=Q(customer_type='company')),
+        government=Count('id', filter=Q(customer_type='government')),
+        ngo=Count('id', filter=Q(customer_type='ngo')),
+    )
+    total_orders = order_totals['total']
     # Completed counted by completion time within the selected period
     completed_orders = scope_queryset(Order.objects.filter(
         completed_at__gte=start_dt,
         completed_at__lt=end_dt,
         status='completed',
     ), request.user, request).count()
-    pending_orders = qs.filter(status__in=['created', 'in_progress']).count()
-    total_customers = cqs.count()
+    pending_orders = order_totals['created'] + order_totals['in_progress']
+    total_customers = customer_totals['total']
 
     completion_rate = int((completed_orders * 100) / total_orders) if total_orders > 0 else 0
 
-    # Average duration
-    avg_duration_qs = qs.filter(
-        actual_duration__isnull=False
-    ).aggregate(avg_duration=Avg('actual_duration'))
-    avg_duration = int(avg_duration_qs['avg_duration'] or 0)
+    # Average duration (Avg skips NULL durations)
+    avg_duration = int(order_totals['avg_duration'] or 0)
 
     stats = {
         'total_orders': total_orders,
@@ -5488,9 +5402,9 @@ def reports_advanced(request: HttpRequest):
         'new_customers': total_customers,
         'avg_service_time': avg_duration,
         # Order type breakdown
-        'service_orders': qs.filter(type='service').count(),
-        'sales_orders': qs.filter(type='sales').count(),
-        'inquiry_orders': qs.filter(type='inquiry').count(),
+        'service_orders': order_totals['service'],
+        'sales_orders': order_totals['sales'],
+        'inquiry_orders': order_totals['inquiry'],
     }
 
     # Calculate percentages
@@ -5523,10 +5437,10 @@ def reports_advanced(request: HttpRequest):
         'status': {
             'labels': ['Created', 'In Progress', 'Completed', 'Cancelled'],
             'values': [
-                qs.filter(status='created').count(),
-                qs.filter(status='in_progress').count(),
-                scope_queryset(Order.objects.filter(completed_at__gte=start_dt, completed_at__lt=end_dt, status='completed'), request.user, request).count(),
-                qs.filter(status='cancelled').count(),
+                order_totals['created'],
+                order_totals['in_progress'],
+                completed_orders,
+                order_totals['cancelled'],
             ]
         },
         'orders': {
@@ -5536,10 +5450,10 @@ def reports_advanced(request: HttpRequest):
         'types': {
             'labels': ['Personal', 'Company', 'Government', 'NGO'],
             'values': [
-                cqs.filter(customer_type='personal').count(),
-                cqs.filter(customer_type='company').count(),
-                cqs.filter(customer_type='government').count(),
-                cqs.filter(customer_type='ngo').count(),
+                customer_totals['personal'],
+                customer_totals['company'],
+                customer_totals['government'],
+                customer_totals['ngo'],
             ]
         }
     }
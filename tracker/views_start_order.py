@@ -13,7 +13,7 @@ from django.utils import timezone
 from django.db import transaction
 
 from .models import Order, Customer, Vehicle, Branch, DocumentScan, DocumentExtraction, DocumentExtractionItem, ServiceType
-from .utils import get_user_branch
+from .utils import get_user_branch, get_service_types, catalog_minutes
 from .extraction_utils import process_invoice_extraction
 
 logger = logging.getLogger(__name__)
@@ -92,8 +92,7 @@ def api_start_order(request):
             # Calculate estimated duration from selected services if provided
             try:
                 if service_selection and order_type == 'service':
-                    svc_objs = ServiceType.objects.filter(name__in=service_selection, is_active=True)
-                    total_minutes = sum(int(s.estimated_minutes or 0) for s in svc_objs)
+                    total_minutes = catalog_minutes(get_service_types(), service_selection)
                     if total_minutes:
                         estimated_duration = total_minutes
             except Exception:
@@ -152,8 +151,8 @@ def api_check_plate(request):
 def api_service_types(request):
     """Return list of active service types for UI checkboxes."""
     try:
-        svc_qs = ServiceType.objects.filter(is_active=True).order_by('name')
-        service_types = [{'name': s.name, 'estimated_minutes': s.estimated_minutes or 0} for s in svc_qs]
+        svc_rows = ServiceType.objects.filter(is_active=True).order_by('name').values_list('name', 'estimated_minutes')
+        service_types = [{'name': name, 'estimated_minutes': minutes or 0} for name, minutes in svc_rows]
         return JsonResponse({'service_types': service_types})
     except Exception as e:
         logger.error(f"Error fetching service types: {e}")